@@ -0,0 +1,170 @@
+import os
+import argparse
+import multiprocessing
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from tabulate import tabulate
+from tqdm import tqdm
+from DataUtils.pricePanel import load_price_panel
+from Cointegration.batchCoint import batch_coint
+from Cointegration.cointegration import P_VALUE_THRESHOLD
+from Reversion.zScore import batch_reversion_stats, Z_SCORE_MIN, Z_SCORE_MAX, MAX_HALF_LIFE
+from StatsDisplay.postStatProcess import resolve_asset_conflicts
+
+RESULTS_DIR = 'Backtest/Results'
+
+# Hourly bars used to pick pairs, then bars each fold's trades are held for at most before a time stop
+FORMATION_BARS = 500
+TRADING_BARS = 48
+
+TRADE_COLUMNS = ['FOLD', 'ENTRY_TIME', 'EXIT_TIME', 'PAIR', 'SIDE', 'Z_SCORE', 'HALF_LIFE', 'TRADE_PRICE_RATIO',
+                 'MEAN_REVERSION_RATIO', 'EXIT_RATIO', 'BARS_HELD', 'REVERTED', 'PROFIT_PERCENT']
+
+# Price history and fold settings inside each backtest worker
+_values = None
+_times = None
+_tickers = None
+_settings = None
+
+def _init_backtest_worker(values, times, tickers, settings):
+    """Hand each fold worker the price history once, instead of with every fold."""
+    global _values, _times, _tickers, _settings
+    _values, _times, _tickers, _settings = values, times, tickers, settings
+
+def simulate_exits(ratios, target_ratios, long_side):
+    """First bar each trade's price ratio crosses its mean reversion ratio, or the last bar as a time stop.
+
+    ratios is a (bars x trades) matrix of A/B price ratios after entry. Returns the exit bar, the exit ratio and whether
+    the target was reached, the same exit rule sentinel.on_message applies live.
+    """
+    ratios = pd.DataFrame(ratios).ffill().to_numpy()
+    with np.errstate(invalid='ignore'):
+        reached = np.where(long_side, ratios >= target_ratios, ratios <= target_ratios)
+    reverted = reached.any(axis=0)
+    exit_bars = np.where(reverted, reached.argmax(axis=0), len(ratios) - 1)
+    return exit_bars, ratios[exit_bars, np.arange(ratios.shape[1])], reverted
+
+def run_fold(fold_start):
+    """Pick pairs on one formation window, enter them at its last bar and exit them over the following trading window."""
+    formation, trading = _settings['formation'], _settings['trading']
+    window = _values[fold_start:fold_start + formation]
+    after = _values[fold_start + formation:fold_start + formation + trading]
+
+    # Only tickers with a full formation window and a price at entry take part in the fold
+    listed = np.flatnonzero(np.isfinite(window).all(axis=0))
+    if len(listed) < 2 or not len(after):
+        return []
+    index_a, index_b = np.triu_indices(len(listed), k=1)
+    index_a, index_b = listed[index_a], listed[index_b]
+
+    _, p_values, _ = batch_coint(window, index_a, index_b, progress=False)
+    cointegrated = p_values < _settings['p_value']
+    index_a, index_b = index_a[cointegrated], index_b[cointegrated]
+    if not len(index_a):
+        return []
+
+    _, passing, last_z_scores, half_lives, mean_reversion_ratios = batch_reversion_stats(
+        window, index_a, index_b, z_min=_settings['z_min'], z_max=_settings['z_max'], max_half_life=_settings['max_half_life'])
+    entry_prices = window[-1]
+
+    # Same entry rules as the hourly job: side from the sign of Z, then drop trades conflicting on an asset
+    candidates = []
+    for k in np.flatnonzero(passing):
+        candidates.append({
+            "ASSET_A": _tickers[index_a[k]],
+            "ASSET_B": _tickers[index_b[k]],
+            "SIDE": "long" if last_z_scores[k] < 0 else "short",
+            "HALF_LIFE": half_lives[k],
+            "Z_SCORE": last_z_scores[k],
+            "MEAN_REVERSION_RATIO": mean_reversion_ratios[k],
+            "TRADE_PRICE_RATIO": entry_prices[index_a[k]] / entry_prices[index_b[k]],
+            "index_a": index_a[k],
+            "index_b": index_b[k],
+        })
+    trades = resolve_asset_conflicts(candidates)
+    if not trades:
+        return []
+
+    # Exits for every trade in the fold at once
+    trade_a = np.array([trade['index_a'] for trade in trades])
+    trade_b = np.array([trade['index_b'] for trade in trades])
+    long_side = np.array([trade['SIDE'] == 'long' for trade in trades])
+    targets = np.array([trade['MEAN_REVERSION_RATIO'] for trade in trades])
+    entry_ratios = np.array([trade['TRADE_PRICE_RATIO'] for trade in trades])
+    exit_bars, exit_ratios, reverted = simulate_exits(after[:, trade_a] / after[:, trade_b], targets, long_side)
+    profits = np.where(long_side, exit_ratios - entry_ratios, entry_ratios - exit_ratios) / entry_ratios * 100
+
+    entry_time = _times[fold_start + formation - 1]
+    results = []
+    for k, trade in enumerate(trades):
+        results.append([
+            fold_start, entry_time, _times[fold_start + formation + exit_bars[k]], f"{trade['ASSET_A']}/{trade['ASSET_B']}",
+            trade['SIDE'], trade['Z_SCORE'], trade['HALF_LIFE'], round(entry_ratios[k], 5), trade['MEAN_REVERSION_RATIO'],
+            round(exit_ratios[k], 5), int(exit_bars[k]) + 1, bool(reverted[k]), round(profits[k], 4),
+        ])
+    return results
+
+def run_backtest(panel=None, formation=FORMATION_BARS, trading=TRADING_BARS, workers=1, p_value=P_VALUE_THRESHOLD,
+                 z_min=Z_SCORE_MIN, z_max=Z_SCORE_MAX, max_half_life=MAX_HALF_LIFE):
+    """Walk forward over the stored candle history in back-to-back folds, running the folds in parallel."""
+    if panel is None:
+        panel = load_price_panel()
+
+    values = panel.to_numpy()
+    times = panel.index.to_numpy()
+    tickers = list(panel.columns)
+    settings = {'formation': formation, 'trading': trading, 'p_value': p_value, 'z_min': z_min, 'z_max': z_max,
+                'max_half_life': max_half_life}
+    fold_starts = list(range(0, len(values) - formation, trading))
+    if not fold_starts:
+        print(f"Not enough history for a {formation}-bar formation window and a trading window.")
+        return pd.DataFrame(columns=TRADE_COLUMNS)
+
+    if workers <= 1:
+        _init_backtest_worker(values, times, tickers, settings)
+        fold_results = [run_fold(fold_start) for fold_start in tqdm(fold_starts, desc="Backtesting Folds")]
+    else:
+        with multiprocessing.Pool(processes=workers, initializer=_init_backtest_worker, initargs=(values, times, tickers, settings)) as pool:
+            fold_results = list(tqdm(pool.imap(run_fold, fold_starts), total=len(fold_starts), desc="Backtesting Folds"))
+
+    return pd.DataFrame([trade for trades in fold_results for trade in trades], columns=TRADE_COLUMNS)
+
+def summarize_backtest(trades):
+    """Headline numbers for a backtest's trades."""
+    if trades.empty:
+        return {"trades": 0, "folds_traded": 0, "win_rate": 0.0, "reverted_rate": 0.0, "mean_profit_percent": 0.0,
+                "total_profit_percent": 0.0, "mean_bars_held": 0.0}
+    return {
+        "trades": len(trades),
+        "folds_traded": trades['FOLD'].nunique(),
+        "win_rate": round((trades['PROFIT_PERCENT'] > 0).mean() * 100, 2),
+        "reverted_rate": round(trades['REVERTED'].mean() * 100, 2),
+        "mean_profit_percent": round(trades['PROFIT_PERCENT'].mean(), 4),
+        "total_profit_percent": round(trades['PROFIT_PERCENT'].sum(), 4),
+        "mean_bars_held": round(trades['BARS_HELD'].mean(), 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Walk-forward backtest of the cointegration and z-score rules over the stored candles.")
+    parser.add_argument("--formation", type=int, default=FORMATION_BARS, help="Bars in each fold's pair selection window.")
+    parser.add_argument("--trading", type=int, default=TRADING_BARS, help="Bars each fold's trades are held for at most; also the fold step.")
+    parser.add_argument("--workers", type=int, default=1, help="Number of processes to run folds across.")
+    parser.add_argument("--p-value", type=float, default=P_VALUE_THRESHOLD, help="Cointegration p-value threshold.")
+    parser.add_argument("--z-min", type=float, default=Z_SCORE_MIN, help="Lower edge of the |Z| entry band.")
+    parser.add_argument("--z-max", type=float, default=Z_SCORE_MAX, help="Upper edge of the |Z| entry band.")
+    parser.add_argument("--max-half-life", type=float, default=MAX_HALF_LIFE, help="Longest half-life accepted.")
+    args = parser.parse_args()
+
+    trades = run_backtest(formation=args.formation, trading=args.trading, workers=args.workers, p_value=args.p_value,
+                          z_min=args.z_min, z_max=args.z_max, max_half_life=args.max_half_life)
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    results_path = os.path.join(RESULTS_DIR, f"{datetime.now().strftime('%Y-%m-%d-%H-%M-%S')}.csv")
+    trades.to_csv(results_path, index=False)
+
+    print(tabulate(summarize_backtest(trades).items(), headers=["METRIC", "VALUE"], tablefmt="grid"))
+    print(f"\nBacktest trades saved to {results_path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+import os
+import argparse
+import itertools
+import multiprocessing
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from tabulate import tabulate
+from tqdm import tqdm
+from DataUtils.pricePanel import load_price_panel
+from Cointegration.batchCoint import batch_coint
+from Cointegration.cointegration import P_VALUE_THRESHOLD
+from Reversion.zScore import autocorrelation, calculate_half_lives, has_periodic_peaks, Z_SCORE_MIN, Z_SCORE_MAX, MAX_HALF_LIFE, LAG_INTERVAL
+from StatsDisplay.postStatProcess import resolve_asset_conflicts
+from Backtest.backtest import simulate_exits, RESULTS_DIR, FORMATION_BARS, TRADING_BARS
+
+PARAMETER_COLUMNS = ['P_VALUE', 'Z_MIN', 'Z_MAX', 'MAX_HALF_LIFE', 'LAG_INTERVAL']
+RESULT_COLUMNS = PARAMETER_COLUMNS + ['TRADES', 'WIN_RATE', 'REVERTED_RATE', 'MEAN_PROFIT_PERCENT', 'TOTAL_PROFIT_PERCENT', 'MEAN_BARS_HELD']
+
+# Grid used for any parameter not given on the command line
+DEFAULT_GRID = {
+    'p_value': [0.01, P_VALUE_THRESHOLD, 0.1],
+    'z_min': [1.0, Z_SCORE_MIN, 1.5],
+    'z_max': [2.0, Z_SCORE_MAX, 3.0],
+    'max_half_life': [12, MAX_HALF_LIFE, 48],
+    'lag_interval': [12, LAG_INTERVAL],
+}
+
+# Price history and the parameter grid inside each sweep worker
+_values = None
+_tickers = None
+_settings = None
+
+def _init_sweep_worker(values, tickers, settings):
+    """Hand each fold worker the price history and grid once, instead of with every fold."""
+    global _values, _tickers, _settings
+    _values, _tickers, _settings = values, tickers, settings
+
+def fold_intermediates(window, after, p_value_max, lag_intervals):
+    """Per-pair p-values, Z-scores, half-lives, periodicity and trade outcomes for one fold, shared by every grid point.
+
+    Only pairs below the loosest p-value in the grid are carried past the cointegration test.
+    """
+    listed = np.flatnonzero(np.isfinite(window).all(axis=0))
+    if len(listed) < 2 or not len(after):
+        return None
+    index_a, index_b = np.triu_indices(len(listed), k=1)
+    index_a, index_b = listed[index_a], listed[index_b]
+
+    _, p_values, _ = batch_coint(window, index_a, index_b, progress=False)
+    candidates = p_values < p_value_max
+    index_a, index_b, p_values = index_a[candidates], index_b[candidates], p_values[candidates]
+    if not len(index_a):
+        return None
+
+    # The same spread statistics batch_reversion_stats computes, for every candidate rather than only band survivors
+    spreads = np.log(window[:, index_a] / window[:, index_b])
+    spread_means = spreads.mean(axis=0)
+    z_scores = (spreads - spread_means) / spreads.std(axis=0, ddof=1)
+    autocorr_values = autocorrelation(z_scores.T, len(z_scores) // 2 - 1)
+
+    long_side = z_scores[-1] < 0
+    entry_ratios = window[-1, index_a] / window[-1, index_b]
+    targets = np.round(np.exp(spread_means), 5)
+    exit_bars, exit_ratios, reverted = simulate_exits(after[:, index_a] / after[:, index_b], targets, long_side)
+
+    return {
+        'index_a': index_a,
+        'index_b': index_b,
+        'p_values': p_values,
+        'abs_z_scores': np.abs(z_scores[-1]),
+        'half_lives': calculate_half_lives(spreads),
+        'periodic': {lag_interval: has_periodic_peaks(autocorr_values, lag_interval=lag_interval) for lag_interval in lag_intervals},
+        'long_side': long_side,
+        'profits': np.where(long_side, exit_ratios - entry_ratios, entry_ratios - exit_ratios) / entry_ratios * 100,
+        'reverted': reverted,
+        'bars_held': exit_bars + 1,
+    }
+
+def sweep_fold(fold_start):
+    """Trade counts and profit sums for every grid point on one fold, as a (grid points x 5) array."""
+    formation, trading, grid = _settings['formation'], _settings['trading'], _settings['grid']
+    window = _values[fold_start:fold_start + formation]
+    after = _values[fold_start + formation:fold_start + formation + trading]
+
+    totals = np.zeros((len(grid), 5))
+    fold = fold_intermediates(window, after, max(point[0] for point in grid), sorted({point[4] for point in grid}))
+    if fold is None:
+        return totals
+
+    for g, (p_value, z_min, z_max, max_half_life, lag_interval) in enumerate(grid):
+        passing = ((fold['p_values'] < p_value) & (fold['abs_z_scores'] >= z_min) & (fold['abs_z_scores'] <= z_max)
+                   & (fold['half_lives'] <= max_half_life) & fold['periodic'][lag_interval])
+        candidates = [{
+            "ASSET_A": _tickers[fold['index_a'][k]],
+            "ASSET_B": _tickers[fold['index_b'][k]],
+            "SIDE": "long" if fold['long_side'][k] else "short",
+            "HALF_LIFE": fold['half_lives'][k],
+            "k": k,
+        } for k in np.flatnonzero(passing)]
+        trades = np.array([trade['k'] for trade in resolve_asset_conflicts(candidates)], dtype=int)
+
+        profits = fold['profits'][trades]
+        totals[g] = [len(trades), (profits > 0).sum(), fold['reverted'][trades].sum(), np.nansum(profits), fold['bars_held'][trades].sum()]
+    return totals
+
+def run_sweep(grid, panel=None, formation=FORMATION_BARS, trading=TRADING_BARS, workers=1):
+    """Backtest every combination of the parameter grid, computing each fold's per-pair intermediates only once."""
+    if panel is None:
+        panel = load_price_panel()
+
+    points = [point for point in itertools.product(grid['p_value'], grid['z_min'], grid['z_max'], grid['max_half_life'], grid['lag_interval'])
+              if point[1] < point[2]]
+    values = panel.to_numpy()
+    tickers = list(panel.columns)
+    settings = {'formation': formation, 'trading': trading, 'grid': points}
+    fold_starts = list(range(0, len(values) - formation, trading))
+    print(f"Sweeping {len(points)} parameter sets over {len(fold_starts)} folds.")
+
+    if workers <= 1:
+        _init_sweep_worker(values, tickers, settings)
+        fold_totals = [sweep_fold(fold_start) for fold_start in tqdm(fold_starts, desc="Sweeping Folds")]
+    else:
+        with multiprocessing.Pool(processes=workers, initializer=_init_sweep_worker, initargs=(values, tickers, settings)) as pool:
+            fold_totals = list(tqdm(pool.imap(sweep_fold, fold_starts), total=len(fold_starts), desc="Sweeping Folds"))
+
+    trades, wins, reverted, profit, bars_held = np.sum(fold_totals, axis=0).T if fold_totals else np.zeros((5, len(points)))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        results = pd.DataFrame(points, columns=PARAMETER_COLUMNS).assign(
+            TRADES=trades.astype(int),
+            WIN_RATE=np.round(np.nan_to_num(wins / trades * 100), 2),
+            REVERTED_RATE=np.round(np.nan_to_num(reverted / trades * 100), 2),
+            MEAN_PROFIT_PERCENT=np.round(np.nan_to_num(profit / trades), 4),
+            TOTAL_PROFIT_PERCENT=np.round(profit, 4),
+            MEAN_BARS_HELD=np.round(np.nan_to_num(bars_held / trades), 2),
+        )
+    return results.sort_values('TOTAL_PROFIT_PERCENT', ascending=False, kind='stable').reset_index(drop=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep the filter thresholds over walk-forward folds of the stored candles.")
+    parser.add_argument("--formation", type=int, default=FORMATION_BARS, help="Bars in each fold's pair selection window.")
+    parser.add_argument("--trading", type=int, default=TRADING_BARS, help="Bars each fold's trades are held for at most; also the fold step.")
+    parser.add_argument("--workers", type=int, default=1, help="Number of processes to run folds across.")
+    parser.add_argument("--p-value", type=float, nargs='+', help="Cointegration p-value thresholds to try.")
+    parser.add_argument("--z-min", type=float, nargs='+', help="Lower edges of the |Z| entry band to try.")
+    parser.add_argument("--z-max", type=float, nargs='+', help="Upper edges of the |Z| entry band to try.")
+    parser.add_argument("--max-half-life", type=float, nargs='+', help="Half-life caps to try.")
+    parser.add_argument("--lag-interval", type=int, nargs='+', help="Autocorrelation peak spacings to try.")
+    parser.add_argument("--top", type=int, default=10, help="Number of best parameter sets to print.")
+    args = parser.parse_args()
+
+    grid = {name: getattr(args, name) or default for name, default in DEFAULT_GRID.items()}
+    results = run_sweep(grid, formation=args.formation, trading=args.trading, workers=args.workers)
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    results_path = os.path.join(RESULTS_DIR, f"sweep-{datetime.now().strftime('%Y-%m-%d-%H-%M-%S')}.csv")
+    results.to_csv(results_path, index=False)
+
+    print(tabulate(results.head(args.top), headers=RESULT_COLUMNS, tablefmt="grid", showindex=False))
+    print(f"\nSweep results saved to {results_path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import os
+import time
+import argparse
+import tempfile
+import functools
+import tracemalloc
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from tabulate import tabulate
+from DataUtils.candleStore import get_candle_store, DATA_DIR
+from DataUtils.pricePanel import load_price_panel, MIN_ROWS
+from Cointegration.cointegration import run_cointegration_analysis
+from Cointegration.streamingScan import stream_fetch_and_scan
+from Reversion.zScore import run_zscore_analysis, clear_charts_directory
+from StatsDisplay.postStatProcess import process_and_display_stats, TRADES_DIR
+
+RESULTS_DIR = 'Benchmarks/Results'
+
+# Panel sizes benchmarked by default
+BENCHMARK_SYMBOLS = [50, 150, 300]
+BENCHMARK_BARS = [500, 1000, 5000]
+
+# One planted cointegrated pair per this many symbols
+SYMBOLS_PER_PLANTED_PAIR = 10
+
+# Synthetic price dynamics: hourly log-return volatility of the random walks, then the AR(1) coefficient and shock size of planted spreads
+RETURN_VOLATILITY = 0.02
+SPREAD_AR_COEFFICIENT = 0.7
+SPREAD_VOLATILITY = 0.01
+
+START_TIME_MS = 1700000000000 - 1700000000000 % (3600 * 1000)
+BAR_MS = 3600 * 1000
+
+RESULT_COLUMNS = ['SYMBOLS', 'BARS', 'STAGE', 'ITEMS', 'SECONDS', 'ITEMS_PER_SECOND', 'PEAK_MB', 'PLANTED', 'RECOVERED']
+
+def generate_synthetic_panel(n_symbols, n_bars, seed=0):
+    """Hourly close paths for n_symbols random walks, some of them paired up into known cointegrated pairs.
+
+    Each planted pair is A = beta * B + alpha * (1 + u) in price levels, the relation the Engle-Granger scan regresses, with
+    u a stationary AR(1) spread. Returns the symbols, the (bars x symbols) close matrix and the planted pairs as sorted
+    (A, B) symbol tuples.
+    """
+    generator = np.random.default_rng(seed)
+    symbols = [f"SYN{k:03d}USDT" for k in range(n_symbols)]
+    log_prices = np.cumsum(generator.normal(0, RETURN_VOLATILITY, (n_bars, n_symbols)), axis=0)
+    log_prices += np.log(generator.uniform(0.1, 100, n_symbols))
+    closes = np.exp(log_prices)
+
+    planted = []
+    order = generator.permutation(n_symbols)
+    for k in range(n_symbols // SYMBOLS_PER_PLANTED_PAIR):
+        a, b = order[2 * k], order[2 * k + 1]
+        spread = np.zeros(n_bars)
+        shocks = generator.normal(0, SPREAD_VOLATILITY, n_bars)
+        for t in range(1, n_bars):
+            spread[t] = SPREAD_AR_COEFFICIENT * spread[t - 1] + shocks[t]
+        closes[:, a] = generator.uniform(0.5, 2.0) * closes[:, b] + closes[:, b].mean() * (1 + spread)
+        planted.append(tuple(sorted((symbols[a], symbols[b]))))
+
+    return symbols, closes, planted
+
+def write_synthetic_candles(symbols, closes, store):
+    """Write synthetic closes as hourly OHLCV candles, one file per symbol in the candle store layout."""
+    times = START_TIME_MS + BAR_MS * np.arange(len(closes))
+    for k, symbol in enumerate(symbols):
+        close = closes[:, k]
+        open_ = np.concatenate([[close[0]], close[:-1]])
+        candles = np.column_stack([times, open_, np.maximum(open_, close), np.minimum(open_, close), close, np.ones(len(close))])
+        store.write(symbol, candles.tolist())
+
+def simulated_fetch(symbols, timeframe, limit, save=False, incremental=False, ready_queue=None, closes=None, store=None, fetch_seconds=0.0):
+    """Stand-in for fetch_all_candle_data that stores each symbol's synthetic candles at an even pace over fetch_seconds."""
+    for k, symbol in enumerate(symbols):
+        time.sleep(fetch_seconds / len(symbols))
+        write_synthetic_candles([symbol], closes[:, [k]], store)
+        if ready_queue is not None:
+            ready_queue.put(symbol)
+
+def fetch_then_scan(symbols, fetch, n_bars, workers, min_rows, store):
+    """The unstreamed job: fetch every symbol, then load the panel and run the cointegration scan."""
+    fetch(symbols, '1h', n_bars, save=True)
+    return run_cointegration_analysis(load_price_panel(store, min_rows=min_rows), workers=workers)
+
+def measure(task):
+    """Run a task once and return its result, wall seconds and peak traced memory in MB."""
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        result = task()
+        seconds = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, seconds, peak / 2 ** 20
+
+def benchmark_size(n_symbols, n_bars, workers=1, storage=None, seed=0, fetch_seconds=None):
+    """Benchmark the pipeline stages on one synthetic panel, written to a scratch workspace so real data is untouched.
+
+    With fetch_seconds, also time a simulated fetch of that length followed by the scan against the streamed pipeline
+    that overlaps them.
+    """
+    symbols, closes, planted = generate_synthetic_panel(n_symbols, n_bars, seed)
+    n_pairs = n_symbols * (n_symbols - 1) // 2
+    rows = []
+
+    original_directory = os.getcwd()
+    with tempfile.TemporaryDirectory() as workspace:
+        # The pipeline reads and writes relative paths, so it runs from inside the workspace
+        os.chdir(workspace)
+        try:
+            store = get_candle_store(storage, DATA_DIR)
+            write_synthetic_candles(symbols, closes, store)
+            os.makedirs(TRADES_DIR, exist_ok=True)
+            clear_charts_directory()
+
+            min_rows = min(n_bars, MIN_ROWS)
+            panel = load_price_panel(store, min_rows=min_rows)
+            passing_pairs, seconds, peak = measure(lambda: run_cointegration_analysis(panel, workers=workers))
+            recovered = len(set(planted) & {(pair['Ax'], pair['Bx']) for pair in passing_pairs})
+            rows.append([n_symbols, n_bars, 'cointegration', n_pairs, seconds, n_pairs / seconds, peak, len(planted), recovered])
+
+            _, seconds, peak = measure(lambda: run_zscore_analysis(passing_pairs, panel))
+            rows.append([n_symbols, n_bars, 'zscore', len(passing_pairs), seconds, len(passing_pairs) / seconds, peak, None, None])
+
+            _, seconds, peak = measure(lambda: process_and_display_stats(workers=workers, min_rows=min_rows))
+            rows.append([n_symbols, n_bars, 'process_and_display_stats', n_pairs, seconds, n_pairs / seconds, peak, None, None])
+
+            if fetch_seconds:
+                fetch = functools.partial(simulated_fetch, closes=closes, store=store, fetch_seconds=fetch_seconds)
+                store.clear()
+                batch_pairs, seconds, peak = measure(lambda: fetch_then_scan(symbols, fetch, n_bars, workers, min_rows, store))
+                rows.append([n_symbols, n_bars, 'fetch_then_scan', n_pairs, seconds, n_pairs / seconds, peak, None, None])
+
+                store.clear()
+                (_, streamed_pairs), seconds, peak = measure(lambda: stream_fetch_and_scan(symbols, fetch, '1h', n_bars, workers=workers,
+                                                                                            min_rows=min_rows, store=store))
+                rows.append([n_symbols, n_bars, 'streamed_fetch_and_scan', n_pairs, seconds, n_pairs / seconds, peak, None, None])
+                if streamed_pairs != batch_pairs:
+                    print(f"Warning: the streamed scan passed {len(streamed_pairs)} pairs, the batch scan {len(batch_pairs)}.")
+        finally:
+            os.chdir(original_directory)
+
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the analysis pipeline offline on synthetic panels with planted cointegrated pairs.")
+    parser.add_argument("--symbols", type=int, nargs='+', default=BENCHMARK_SYMBOLS, help="Panel widths to benchmark.")
+    parser.add_argument("--bars", type=int, nargs='+', default=BENCHMARK_BARS, help="Panel lengths to benchmark.")
+    parser.add_argument("--workers", type=int, default=1, help="Number of processes for the cointegration scan.")
+    parser.add_argument("--storage", choices=['csv', 'npy'], help="Candle storage format to benchmark; defaults to CANDLE_STORAGE.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic panels.")
+    parser.add_argument("--fetch-seconds", type=float, help="Also compare fetching then scanning with the streamed pipeline, simulating a fetch this long.")
+    args = parser.parse_args()
+
+    rows = []
+    for n_symbols in args.symbols:
+        for n_bars in args.bars:
+            print(f"\nBenchmarking {n_symbols} symbols x {n_bars} bars...")
+            rows.extend(benchmark_size(n_symbols, n_bars, workers=args.workers, storage=args.storage, seed=args.seed,
+                                      fetch_seconds=args.fetch_seconds))
+
+    results = pd.DataFrame(rows, columns=RESULT_COLUMNS).round({'SECONDS': 3, 'ITEMS_PER_SECOND': 1, 'PEAK_MB': 1})
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    results_path = os.path.join(RESULTS_DIR, f"{datetime.now().strftime('%Y-%m-%d-%H-%M-%S')}.csv")
+    results.to_csv(results_path, index=False)
+
+    print()
+    print(tabulate(results.fillna(''), headers=RESULT_COLUMNS, tablefmt="grid", showindex=False))
+    print(f"\nBenchmark results saved to {results_path}")
+
+    missed = results.dropna(subset=['PLANTED'])
+    missed = missed[missed['RECOVERED'] < missed['PLANTED']]
+    for _, row in missed.iterrows():
+        print(f"Warning: only {int(row['RECOVERED'])} of {int(row['PLANTED'])} planted pairs recovered at {row['SYMBOLS']} symbols x {row['BARS']} bars.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import numpy as np
+from scipy.stats import norm
+from statsmodels.tsa.adfvalues import tau_max_c, tau_min_c, tau_star_c, tau_c_smallp, tau_c_largep
+from tqdm import tqdm  # For progress bar
+
+# Number of pairs regressed together; bounds the (block x bars x lags) design tensor to a few tens of MB
+BLOCK_SIZE = 256
+
+# Same collinearity cut-off statsmodels' coint uses before giving up on the ADF step
+SQRTEPS = np.sqrt(np.finfo(np.double).eps)
+
+def mackinnon_pvalues(t_stats, n_series=2):
+    """Map Engle-Granger t-statistics to MacKinnon (1994) p-values for a constant-only regression, in bulk."""
+    t_stats = np.asarray(t_stats, dtype=np.float64)
+    with np.errstate(invalid='ignore', over='ignore'):
+        small_p = np.polyval(tau_c_smallp[n_series - 1][::-1], t_stats)
+        large_p = np.polyval(tau_c_largep[n_series - 1][::-1], t_stats)
+        p_values = norm.cdf(np.where(t_stats <= tau_star_c[n_series - 1], small_p, large_p))
+    p_values = np.where(t_stats > tau_max_c[n_series - 1], 1.0, p_values)
+    return np.where(t_stats < tau_min_c[n_series - 1], 0.0, p_values)
+
+def hedge_regression(y, x):
+    """Fit y = alpha + beta * x column-wise and return the hedge ratios, residuals and R-squared."""
+    x_centered = x - x.mean(axis=0)
+    y_centered = y - y.mean(axis=0)
+    beta = (x_centered * y_centered).sum(axis=0) / (x_centered * x_centered).sum(axis=0)
+    residuals = y_centered - beta * x_centered
+    rsquared = 1 - (residuals * residuals).sum(axis=0) / (y_centered * y_centered).sum(axis=0)
+    return beta, residuals, rsquared
+
+def _adf_design(residuals, lags):
+    """Stack the ADF regressors [level, lag 1..lags of the differences] and the differenced target."""
+    diffs = np.diff(residuals, axis=0)
+    nobs = diffs.shape[0] - lags
+    columns = [residuals[lags:lags + nobs]] + [diffs[lags - k:lags - k + nobs] for k in range(1, lags + 1)]
+    return np.stack(columns, axis=-1), diffs[lags:]
+
+def _normal_equations(design, target):
+    """Per-pair Gram matrices X'X, cross-products X'y and y'y for a (bars x pairs x regressors) design."""
+    stacked = np.ascontiguousarray(design.transpose(1, 0, 2))
+    gram = np.matmul(stacked.transpose(0, 2, 1), stacked)
+    cross = np.einsum('tbi,tb->bi', design, target)
+    return gram, cross, (target * target).sum(axis=0)
+
+def adf_tstats(residuals, maxlag=None):
+    """Zero-trend ADF t-statistics with AIC lag selection for every column of a residual matrix."""
+    n_bars, n_pairs = residuals.shape
+    if maxlag is None:
+        # Same default as statsmodels' adfuller for regression="n"
+        maxlag = min(n_bars // 2 - 1, int(np.ceil(12.0 * np.power(n_bars / 100.0, 1 / 4.0))))
+
+    # Lag selection runs every candidate lag on the common sample of the longest one
+    design, target = _adf_design(residuals, maxlag)
+    gram, cross, target_ss = _normal_equations(design, target)
+    nobs = target.shape[0]
+    aic = np.empty((maxlag + 1, n_pairs))
+    for lag in range(maxlag + 1):
+        k = lag + 1
+        coefs = np.linalg.solve(gram[:, :k, :k], cross[:, :k, None])[..., 0]
+        ssr = target_ss - (cross[:, :k] * coefs).sum(axis=1)
+        aic[lag] = nobs * np.log(ssr / nobs) + 2 * k
+    best_lags = np.argmin(aic, axis=0)
+
+    # Re-run each pair's regression with its chosen lag on the full available sample
+    t_stats = np.empty(n_pairs)
+    for lag in np.unique(best_lags):
+        columns = best_lags == lag
+        design, target = _adf_design(residuals[:, columns], lag)
+        gram, cross, target_ss = _normal_equations(design, target)
+        inverse = np.linalg.inv(gram)
+        coefs = np.einsum('bij,bj->bi', inverse, cross)
+        ssr = target_ss - (cross * coefs).sum(axis=1)
+        sigma2 = ssr / (target.shape[0] - (lag + 1))
+        t_stats[columns] = coefs[:, 0] / np.sqrt(sigma2 * inverse[:, 0, 0])
+    return t_stats
+
+def batch_coint(values, index_a, index_b, block_size=BLOCK_SIZE, progress=True):
+    """Engle-Granger test of column index_a on column index_b for many pairs of a gap-free (bars x tickers) matrix.
+
+    Returns the t-statistics, MacKinnon p-values and hedge ratios, matching statsmodels' coint defaults.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n_pairs = len(index_a)
+    t_stats = np.empty(n_pairs)
+    hedge_ratios = np.empty(n_pairs)
+
+    for start in tqdm(range(0, n_pairs, block_size), desc="Calculating Cointegration", unit="block", disable=not progress):
+        block = slice(start, min(start + block_size, n_pairs))
+        beta, residuals, rsquared = hedge_regression(values[:, index_a[block]], values[:, index_b[block]])
+        hedge_ratios[block] = beta
+
+        # Near-perfectly collinear pairs are treated as cointegrated, as coint does
+        collinear = rsquared >= 1 - 100 * SQRTEPS
+        block_t_stats = np.full(len(beta), -np.inf)
+        if not collinear.all():
+            block_t_stats[~collinear] = adf_tstats(residuals[:, ~collinear])
+        t_stats[block] = block_t_stats
+
+    return t_stats, mackinnon_pvalues(t_stats), hedge_ratios
+
+if __name__ == "__main__":
+    # Harness: compare the batch engine against statsmodels' coint on the saved ticker data
+    import argparse
+    from statsmodels.tsa.stattools import coint
+    from DataUtils.pricePanel import load_price_panel
+
+    parser = argparse.ArgumentParser(description="Compare batch_coint against statsmodels coint on Binance/Tickers.")
+    parser.add_argument("--sample", type=int, default=2000, help="Number of random pairs to compare.")
+    parser.add_argument("--threshold", type=float, default=0.04, help="p-value cut-off whose decisions must agree.")
+    args = parser.parse_args()
+
+    panel = load_price_panel().dropna(axis=1)
+    index_a, index_b = np.triu_indices(panel.shape[1], k=1)
+    chosen = np.random.default_rng(0).permutation(len(index_a))[:args.sample]
+    index_a, index_b = index_a[chosen], index_b[chosen]
+
+    _, batch_p_values, _ = batch_coint(panel.to_numpy(), index_a, index_b)
+    reference_p_values = np.array([
+        coint(panel.iloc[:, a], panel.iloc[:, b])[1] for a, b in tqdm(zip(index_a, index_b), total=len(index_a), desc="Reference coint")
+    ])
+
+    mismatches = (batch_p_values < args.threshold) != (reference_p_values < args.threshold)
+    print(f"Compared {len(index_a)} pairs: max |p difference| {np.max(np.abs(batch_p_values - reference_p_values)):.2e}, "
+          f"{mismatches.sum()} decision mismatches at p < {args.threshold}")
+    for a, b, p_batch, p_ref in zip(index_a[mismatches], index_b[mismatches], batch_p_values[mismatches], reference_p_values[mismatches]):
+        print(f"  {panel.columns[a]}/{panel.columns[b]}: batch {p_batch:.5f} vs coint {p_ref:.5f}")
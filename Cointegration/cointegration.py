@@ -1,44 +1,264 @@
 import os
-from statsmodels.tsa.stattools import coint
+import csv
+import multiprocessing
+from collections import deque
+from multiprocessing import shared_memory
+import numpy as np
 import pandas as pd
+from statsmodels.tsa.stattools import coint
 from tqdm import tqdm  # For progress bar
+from DataUtils.pricePanel import load_price_panel, get_pair_series, timeline_groups
+from Cointegration.batchCoint import batch_coint, hedge_regression, mackinnon_pvalues, SQRTEPS
+from Cointegration.preScreen import prescreen_pairs
+from Instrumentation.stageMetrics import record_items
+from Cointegration.pairCache import load_pair_cache, save_pair_cache, evict_delisted, pairs_to_retest, update_pair_cache, cached_p_values
+
+P_VALUE_THRESHOLD = 0.04
+
+# Latest passing pairs, read by the live signal streamer
+COINTEGRATED_PAIRS_FILE = 'Cointegration/cointegrated_pairs.csv'
+
+# Rolling mode: bars per window and the fixed number of lagged differences in the ADF regression
+ROLLING_WINDOW = 500
+ROLLING_ADF_LAGS = 0
+
+# Chunks handed out per worker, so faster workers pick up the slack near the end of the scan
+CHUNKS_PER_WORKER = 4
+
+# Read-only view of the shared price matrix inside each scan worker
+_shared_block = None
+_shared_values = None
+
+def _init_scan_worker(block_name, shape):
+    """Attach a scan worker to the shared price matrix once, instead of pickling it with every chunk."""
+    global _shared_block, _shared_values
+    _shared_block = shared_memory.SharedMemory(name=block_name)
+    _shared_values = np.ndarray(shape, dtype=np.float64, buffer=_shared_block.buf)
+    _shared_values.flags.writeable = False
+
+def _scan_chunk(chunk):
+    """Return the p-values and hedge ratios for one contiguous chunk of the pair space."""
+    index_a, index_b = chunk
+    _, p_values, hedge_ratios = batch_coint(_shared_values, index_a, index_b, progress=False)
+    return p_values, hedge_ratios
 
-TICKERS_DIR = 'Binance/Tickers'
+def scan_pairs(values, index_a, index_b, workers=1):
+    """Run the batch engine over the pair space, fanning contiguous chunks out to worker processes."""
+    if workers <= 1 or len(index_a) == 0:
+        _, p_values, hedge_ratios = batch_coint(values, index_a, index_b)
+        return p_values, hedge_ratios
 
-def load_data(file_path):
-    """Load CSV data into a pandas DataFrame and ensure it has at least 1000 rows."""
-    df = pd.read_csv(file_path)
-    # Only return data if it has at least 1000 rows
-    return df['Close'] if 'Close' in df.columns and len(df) >= 1000 else None
+    values = np.ascontiguousarray(values, dtype=np.float64)
+    block = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+    try:
+        np.ndarray(values.shape, dtype=np.float64, buffer=block.buf)[:] = values
+        bounds = np.linspace(0, len(index_a), workers * CHUNKS_PER_WORKER + 1, dtype=int)
+        chunks = [(index_a[start:stop], index_b[start:stop]) for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
 
-def align_data(df1, df2):
-    """Align two DataFrames based on their timestamps."""
-    aligned_data = pd.concat([df1, df2], axis=1, join='inner')
-    return aligned_data.iloc[:, 0], aligned_data.iloc[:, 1]
+        with multiprocessing.Pool(processes=workers, initializer=_init_scan_worker, initargs=(block.name, values.shape)) as pool:
+            # imap keeps chunk order, so the merged results line up with the pair index arrays
+            results = list(tqdm(pool.imap(_scan_chunk, chunks), total=len(chunks), desc="Calculating Cointegration", unit="chunk"))
+    finally:
+        block.close()
+        block.unlink()
 
-def run_cointegration_analysis():
+    return np.concatenate([p_values for p_values, _ in results]), np.concatenate([hedge_ratios for _, hedge_ratios in results])
+
+def test_pairs(panel, index_a, index_b, workers=1):
+    """Return the Engle-Granger p-values and hedge ratios for the given pairs of panel columns."""
+    tickers = list(panel.columns)
+    p_values = np.full(len(index_a), np.nan)
+    hedge_ratios = np.full(len(index_a), np.nan)
+
+    # Pairs whose tickers have prices at exactly the same timestamps go through the batch engine on those rows
+    values = panel.to_numpy()
+    observed, groups = timeline_groups(values)
+    batched = groups[index_a] == groups[index_b]
+    for group in np.unique(groups[index_a[batched]]):
+        in_group = batched & (groups[index_a] == group)
+        rows = observed[:, index_a[in_group][0]]
+        p_values[in_group], hedge_ratios[in_group] = scan_pairs(values[rows], index_a[in_group], index_b[in_group], workers)
+
+    # Pairs whose legs have different timelines are aligned individually and tested with statsmodels
+    for k in np.flatnonzero(~batched):
+        aligned_data_a, aligned_data_b = get_pair_series(panel, tickers[index_a[k]], tickers[index_b[k]])
+        _, p_values[k], _ = coint(aligned_data_a, aligned_data_b)
+        hedge_ratios[k] = hedge_regression(aligned_data_a.to_numpy()[:, None], aligned_data_b.to_numpy()[:, None])[0][0]
+
+    return p_values, hedge_ratios
+
+def run_cointegration_analysis(panel=None, workers=1, prescreen='off', prescreen_threshold=None, baskets=None, pair_cache=False):
     """Run cointegration test and return pairs meeting the p-value criteria."""
-    tickers = [f.replace('.csv', '') for f in os.listdir(TICKERS_DIR) if f.endswith('.csv')]
-    pairs = [{"Ax": tickers[i], "Bx": tickers[j]} for i in range(len(tickers)) for j in range(i + 1, len(tickers))]
+    if panel is None:
+        panel = load_price_panel()
+
+    tickers = list(panel.columns)
+    index_a, index_b = np.triu_indices(len(tickers), k=1)
+    total_pairs = len(index_a)
+
+    # Drop obviously unrelated pairs in bulk before paying for the full test
+    survivors = prescreen_pairs(panel, index_a, index_b, prescreen, prescreen_threshold, baskets)
+    index_a, index_b = index_a[survivors], index_b[survivors]
+
+    if pair_cache:
+        # Only re-test pairs that are uncached, near the threshold or due for their periodic re-test
+        cache = load_pair_cache()
+        evict_delisted(cache, tickers)
+        keys = [f"{tickers[a]}/{tickers[b]}" for a, b in zip(index_a, index_b)]
+        window_end, window_bars = int(panel.index[-1]), len(panel)
+        retest = pairs_to_retest(cache, keys, window_end, window_bars)
+        p_values = np.full(len(index_a), np.nan)
+        p_values[~retest] = cached_p_values(cache, [key for key, stale in zip(keys, retest) if not stale])
+        p_values[retest], hedge_ratios = test_pairs(panel, index_a[retest], index_b[retest], workers)
+        update_pair_cache(cache, [key for key, stale in zip(keys, retest) if stale], p_values[retest], hedge_ratios, window_end, window_bars)
+        save_pair_cache(cache)
+        print(f"Pair cache: re-tested {retest.sum()} of {len(keys)} pairs, reused {len(keys) - retest.sum()} cached results.")
+        record_items(pairs_tested=retest.sum(), pairs_cached=len(keys) - retest.sum())
+    else:
+        p_values, _ = test_pairs(panel, index_a, index_b, workers)
+        record_items(pairs_tested=len(index_a))
+
+    passing = np.flatnonzero(p_values < P_VALUE_THRESHOLD)
+    record_items(pairs_total=total_pairs, pairs_prescreened_out=total_pairs - len(index_a), pairs_passed=len(passing))
+    if prescreen != 'off':
+        print(f"Pre-screen ({prescreen}) pruned {total_pairs - len(index_a)} of {total_pairs} pairs; "
+              f"{len(passing)} of {len(index_a)} survivors passed cointegration.")
 
     passing_pairs = []
-    for pair in tqdm(pairs, desc="Calculating Cointegration"):
-        file_a = os.path.join(TICKERS_DIR, f"{pair['Ax']}.csv")
-        file_b = os.path.join(TICKERS_DIR, f"{pair['Bx']}.csv")
-        data_a = load_data(file_a)
-        data_b = load_data(file_b)
-
-        # Skip pair if either ticker has insufficient data
-        if data_a is None or data_b is None:
-            continue
-
-        aligned_data_a, aligned_data_b = align_data(data_a, data_b)
-
-        _, p_value, _ = coint(aligned_data_a, aligned_data_b)
-        if p_value < 0.04:
-            passing_pairs.append({
-                "Ax": pair["Ax"],
-                "Bx": pair["Bx"],
-                "p_value": round(p_value, 4)
-            })
+    for k in passing:
+        passing_pairs.append({
+            "Ax": tickers[index_a[k]],
+            "Bx": tickers[index_b[k]],
+            "p_value": round(float(p_values[k]), 4)
+        })
     return passing_pairs
+
+def save_cointegrated_pairs(pairs, path=COINTEGRATED_PAIRS_FILE):
+    """Persist the pairs passing the latest cointegration run."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, mode='w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=["Ax", "Bx", "p_value"])
+        writer.writeheader()
+        writer.writerows({"Ax": pair["Ax"], "Bx": pair["Bx"], "p_value": pair["p_value"]} for pair in pairs)
+
+def load_cointegrated_pairs(path=COINTEGRATED_PAIRS_FILE):
+    """Load the pairs passing the latest cointegration run, or an empty list."""
+    if not os.path.isfile(path):
+        return []
+    with open(path, newline='') as file:
+        return [{"Ax": row["Ax"], "Bx": row["Bx"], "p_value": float(row["p_value"])} for row in csv.DictReader(file)]
+
+class RollingCointegration:
+    """Rolling-window Engle-Granger test for a fixed set of pairs, updated in O(1) per bar.
+
+    Keeps per-pair running sums of [1, x, y] cross-products for the hedge regression, and of the cross-products of
+    [1, y(t-1), x(t-1), dy(t), dx(t), dy(t-1), dx(t-1), ...] for the ADF regression. Residuals are linear in those
+    terms for a given hedge ratio, so the ADF regression on the window's residuals is rebuilt from the running sums
+    instead of from the bars. The ADF step uses a fixed number of lags since an AIC search cannot be kept up to date
+    incrementally.
+    """
+
+    def __init__(self, n_pairs, window=ROLLING_WINDOW, lags=ROLLING_ADF_LAGS):
+        self.window = window
+        self.lags = lags
+        self.hedge_sums = np.zeros((n_pairs, 3, 3))
+        self.adf_sums = np.zeros((n_pairs, 5 + 2 * lags, 5 + 2 * lags))
+        self.bars = deque()
+        self.recent_bars = deque(maxlen=lags + 2)  # Just the bars the newest ADF terms need
+        self.terms = deque()
+        self.reference = None
+        self.pushes = 0
+
+    def _adf_terms(self):
+        """ADF cross-product terms for the newest bar, or None until enough bars are buffered."""
+        if len(self.recent_bars) < self.lags + 2:
+            return None
+        recent = np.stack(self.recent_bars)  # (lags + 2, pairs, [x, y])
+        diffs = np.diff(recent, axis=0)[::-1]  # dx/dy at t, t-1, ..., t-lags
+        previous = recent[-2]
+        return np.concatenate([np.ones((len(previous), 1)), previous[:, [1, 0]], diffs[:, :, [1, 0]].transpose(1, 0, 2).reshape(len(previous), -1)], axis=1)
+
+    def push(self, prices_a, prices_b):
+        """Add the newest bar for every pair and drop the bar that falls out of the window."""
+        bar = np.column_stack([prices_b, prices_a]).astype(np.float64)
+        if self.reference is None:
+            # Shifting each leg by its first price keeps the running sums small; it does not change the test
+            self.reference = bar.copy()
+        bar = bar - self.reference
+
+        hedge = np.column_stack([np.ones(len(bar)), bar])
+        self.hedge_sums += hedge[:, :, None] * hedge[:, None, :]
+        self.bars.append(bar)
+        self.recent_bars.append(bar)
+        terms = self._adf_terms()
+        if terms is not None:
+            self.adf_sums += terms[:, :, None] * terms[:, None, :]
+            self.terms.append(terms)
+
+        if len(self.bars) > self.window:
+            leaving = np.column_stack([np.ones(len(bar)), self.bars.popleft()])
+            self.hedge_sums -= leaving[:, :, None] * leaving[:, None, :]
+        if len(self.terms) > self.window - 1 - self.lags:
+            leaving = self.terms.popleft()
+            self.adf_sums -= leaving[:, :, None] * leaving[:, None, :]
+
+        # Re-derive the sums from the buffered bars once per window so floating-point drift cannot build up
+        self.pushes += 1
+        if self.pushes % self.window == 0:
+            hedge = np.column_stack([np.ones((len(self.bars) * len(bar), 1)), np.concatenate(list(self.bars))]).reshape(len(self.bars), len(bar), 3)
+            self.hedge_sums = np.einsum('tpi,tpj->pij', hedge, hedge)
+            terms = np.stack(list(self.terms))
+            self.adf_sums = np.einsum('tpi,tpj->pij', terms, terms)
+
+    @property
+    def ready(self):
+        return len(self.bars) == self.window
+
+    def statistics(self):
+        """Current ADF t-statistics, MacKinnon p-values and hedge ratios for every pair."""
+        n, sum_x, sum_y = self.hedge_sums[:, 0, 0], self.hedge_sums[:, 0, 1], self.hedge_sums[:, 0, 2]
+        sxx = self.hedge_sums[:, 1, 1] - sum_x * sum_x / n
+        sxy = self.hedge_sums[:, 1, 2] - sum_x * sum_y / n
+        syy = self.hedge_sums[:, 2, 2] - sum_y * sum_y / n
+        beta = sxy / sxx
+        alpha = (sum_y - beta * sum_x) / n
+        rsquared = beta * sxy / syy
+
+        # Regressors [e(t-1), de(t-1), ..., de(t-lags)] and target de(t) as coefficient rows over the ADF terms
+        n_pairs, n_terms = len(beta), self.adf_sums.shape[1]
+        regressors = np.zeros((n_pairs, self.lags + 1, n_terms))
+        regressors[:, 0, 0], regressors[:, 0, 1], regressors[:, 0, 2] = -alpha, 1, -beta
+        for lag in range(1, self.lags + 1):
+            regressors[:, lag, 3 + 2 * lag], regressors[:, lag, 4 + 2 * lag] = 1, -beta
+        target = np.zeros((n_pairs, n_terms))
+        target[:, 3], target[:, 4] = 1, -beta
+
+        gram = regressors @ self.adf_sums @ regressors.transpose(0, 2, 1)
+        cross = np.einsum('pki,pij,pj->pk', regressors, self.adf_sums, target)
+        target_ss = np.einsum('pi,pij,pj->p', target, self.adf_sums, target)
+        inverse = np.linalg.inv(gram)
+        coefs = np.einsum('pij,pj->pi', inverse, cross)
+        ssr = target_ss - (cross * coefs).sum(axis=1)
+        sigma2 = ssr / (len(self.terms) - (self.lags + 1))
+        t_stats = coefs[:, 0] / np.sqrt(sigma2 * inverse[:, 0, 0])
+
+        # Near-perfectly collinear pairs are treated as cointegrated, as coint does
+        t_stats = np.where(rsquared >= 1 - 100 * SQRTEPS, -np.inf, t_stats)
+        return t_stats, mackinnon_pvalues(t_stats), beta
+
+def rolling_cointegration(panel, pairs, window=ROLLING_WINDOW, lags=ROLLING_ADF_LAGS):
+    """Time series of rolling-window cointegration p-values for the given pairs, one column per 'Ax/Bx'."""
+    columns = sorted({pair['Ax'] for pair in pairs} | {pair['Bx'] for pair in pairs})
+    prices = panel[columns].dropna()
+    values_a = prices[[pair['Ax'] for pair in pairs]].to_numpy()
+    values_b = prices[[pair['Bx'] for pair in pairs]].to_numpy()
+
+    rolling = RollingCointegration(len(pairs), window, lags)
+    times, p_values = [], []
+    for k in tqdm(range(len(prices)), desc="Rolling Cointegration"):
+        rolling.push(values_a[k], values_b[k])
+        if rolling.ready:
+            times.append(prices.index[k])
+            p_values.append(rolling.statistics()[1])
+
+    return pd.DataFrame(p_values, index=pd.Index(times, name='Time'), columns=[f"{pair['Ax']}/{pair['Bx']}" for pair in pairs])
@@ -0,0 +1,58 @@
+import os
+import json
+import numpy as np
+
+PAIR_CACHE_FILE = 'Cointegration/pair_cache.json'
+
+# Pairs below this p-value sit close enough to the cut-off that they are re-tested every run
+NEAR_THRESHOLD_P_VALUE = 0.2
+
+# Clear failures are only re-tested once the data window has moved on by this many hours
+FAILED_RETEST_HOURS = 6
+
+MS_PER_HOUR = 3600 * 1000
+
+def load_pair_cache(path=PAIR_CACHE_FILE):
+    """Load cached cointegration results keyed by 'A/B', or an empty cache."""
+    if not os.path.isfile(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+def save_pair_cache(cache, path=PAIR_CACHE_FILE):
+    """Persist the cointegration results for the next run."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, mode='w') as file:
+        json.dump(cache, file)
+
+def evict_delisted(cache, tickers):
+    """Drop cached pairs whose tickers are no longer in the price panel."""
+    active = set(tickers)
+    for key in [key for key in cache if not all(ticker in active for ticker in key.split('/'))]:
+        del cache[key]
+
+def pairs_to_retest(cache, keys, window_end, window_bars):
+    """Mask of the pairs whose cached result is missing, stale, near the threshold or from another window length."""
+    retest = np.ones(len(keys), dtype=bool)
+    for k, key in enumerate(keys):
+        entry = cache.get(key)
+        if entry is None or entry['bars'] != window_bars or entry['tested_at'] > window_end:
+            continue
+        if entry['p_value'] < NEAR_THRESHOLD_P_VALUE:
+            continue
+        retest[k] = (window_end - entry['tested_at']) >= FAILED_RETEST_HOURS * MS_PER_HOUR
+    return retest
+
+def update_pair_cache(cache, keys, p_values, hedge_ratios, window_end, window_bars):
+    """Record freshly tested pairs along with the window they were tested on."""
+    for key, p_value, hedge_ratio in zip(keys, p_values, hedge_ratios):
+        cache[key] = {
+            "p_value": float(p_value),
+            "hedge_ratio": float(hedge_ratio),
+            "tested_at": int(window_end),
+            "bars": int(window_bars),
+        }
+
+def cached_p_values(cache, keys):
+    """Cached p-values for the given pairs."""
+    return np.array([cache[key]['p_value'] for key in keys], dtype=np.float64)
@@ -0,0 +1,49 @@
+import numpy as np
+
+PRESCREEN_METHODS = ['off', 'correlation', 'variance', 'basket']
+
+# Default cut-offs; pairs below the correlation or above the variance ratio are dropped before the full test
+MIN_LOG_CORRELATION = 0.5
+MAX_SPREAD_VARIANCE_RATIO = 0.5
+
+def log_price_covariance(values):
+    """Covariance matrix of log prices for every ticker, computed as a single matrix product."""
+    log_prices = np.log(values)
+    centered = log_prices - log_prices.mean(axis=0)
+    return centered.T @ centered / (len(centered) - 1)
+
+def prescreen_pairs(panel, index_a, index_b, method='off', threshold=None, baskets=None):
+    """Return a mask of the pairs worth running the full cointegration test on."""
+    keep = np.ones(len(index_a), dtype=bool)
+    if method == 'off' or len(index_a) == 0:
+        return keep
+
+    if method == 'basket':
+        # Only keep pairs whose tickers share a sector basket
+        ticker_baskets = {}
+        for basket_name, tickers in (baskets or {}).items():
+            for ticker in tickers:
+                ticker_baskets.setdefault(ticker.strip(), set()).add(basket_name)
+        tickers = list(panel.columns)
+        for k, (a, b) in enumerate(zip(index_a, index_b)):
+            keep[k] = bool(ticker_baskets.get(tickers[a], set()) & ticker_baskets.get(tickers[b], set()))
+        return keep
+
+    # Price statistics only cover gap-free tickers; pairs touching a ticker with gaps are always kept
+    complete = panel.notna().all().to_numpy()
+    covariance = np.full((panel.shape[1], panel.shape[1]), np.nan)
+    covariance[np.ix_(complete, complete)] = log_price_covariance(panel.loc[:, complete].to_numpy())
+    variance = np.diag(covariance)
+    cross = covariance[index_a, index_b]
+
+    if method == 'correlation':
+        threshold = MIN_LOG_CORRELATION if threshold is None else threshold
+        screened = np.abs(cross / np.sqrt(variance[index_a] * variance[index_b])) >= threshold
+    elif method == 'variance':
+        # Variance of the log spread relative to the legs' own variance; ~1 for unrelated random walks
+        threshold = MAX_SPREAD_VARIANCE_RATIO if threshold is None else threshold
+        screened = 1 - 2 * cross / (variance[index_a] + variance[index_b]) <= threshold
+    else:
+        raise ValueError(f"Unknown pre-screen method: {method}")
+
+    return np.where(complete[index_a] & complete[index_b], screened, keep)
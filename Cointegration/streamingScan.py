@@ -0,0 +1,192 @@
+import time
+import queue
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import shared_memory, resource_tracker
+import numpy as np
+import pandas as pd
+from statsmodels.tsa.stattools import coint
+from tqdm import tqdm  # For progress bar
+from DataUtils.candleStore import get_candle_store
+from DataUtils.pricePanel import close_series, build_price_panel, MIN_ROWS
+from Cointegration.batchCoint import batch_coint
+from Cointegration.cointegration import P_VALUE_THRESHOLD, CHUNKS_PER_WORKER
+from Instrumentation.stageMetrics import record_items
+
+def _scan_shared_chunk(task):
+    """Return the p-values for one chunk of pairs, attaching to the shared price block for this chunk only.
+
+    Each streamed batch of symbols gets its own block, so workers of the long-lived pool cannot attach once up front.
+    """
+    block_name, shape, index_a, index_b = task
+    block = shared_memory.SharedMemory(name=block_name)
+    values = None
+    try:
+        values = np.ndarray(shape, dtype=np.float64, buffer=block.buf)
+        _, p_values, _ = batch_coint(values, index_a, index_b, progress=False)
+    finally:
+        del values
+        block.close()
+    return p_values
+
+class StreamingScan:
+    """Engle-Granger pair scan fed one symbol at a time, testing each pair as soon as both of its legs are loaded.
+
+    As in test_pairs, pairs whose legs have prices at exactly the same timestamps go through the batch engine on those
+    rows and the rest through statsmodels on their aligned series. A symbol's timeline is fixed once it is loaded, so
+    every pair is tested once, as it arrives, with the result the batch run gives.
+    """
+
+    def __init__(self, min_rows=MIN_ROWS, pool=None, workers=1):
+        self.min_rows = min_rows
+        self.pool = pool
+        self.workers = workers
+        self.closes = {}
+        self.symbols = []  # Loaded symbols in arrival order
+        self.pending = []  # Loaded symbols whose pairs are not tested yet
+        self.timelines = {}  # Timeline group id, keyed by the timestamps its symbols have prices at
+        self.groups = {}  # Timeline group id per symbol
+        self.members = {}  # Loaded symbols per timeline group
+        self.results = []  # (Ax, Bx, p-values) per scanned batch of symbols
+
+    def add(self, symbol, candles):
+        """Load a fetched symbol's candles, skipping it when it has fewer than min_rows like load_price_panel does."""
+        if candles is None or len(candles) < self.min_rows:
+            return
+        series = close_series(candles).sort_index()
+        self.closes[symbol] = series
+        self.pending.append(symbol)
+
+        # Symbols with prices at exactly the same timestamps share a group, like timeline_groups on the final panel
+        timeline = series.dropna().index.to_numpy().tobytes()
+        group = self.timelines.setdefault(timeline, len(self.timelines))
+        self.groups[symbol] = group
+        self.members.setdefault(group, []).append(symbol)
+
+    def _coint(self, ticker_a, ticker_b):
+        """p-value of one pair on the timestamps both legs have, as test_pairs computes it for pairs with gaps."""
+        aligned_data = pd.DataFrame({ticker_a: self.closes[ticker_a], ticker_b: self.closes[ticker_b]}).sort_index().dropna()
+        return coint(aligned_data[ticker_a], aligned_data[ticker_b])[1]
+
+    def _batch_p_values(self, values, index_a, index_b):
+        """p-values for pairs of gap-free columns, fanned out across the pool in contiguous chunks when there is one."""
+        if self.pool is None or len(index_a) == 0:
+            return batch_coint(values, index_a, index_b, progress=False)[1]
+
+        values = np.ascontiguousarray(values, dtype=np.float64)
+        block = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+        try:
+            np.ndarray(values.shape, dtype=np.float64, buffer=block.buf)[:] = values
+            bounds = np.linspace(0, len(index_a), self.workers * CHUNKS_PER_WORKER + 1, dtype=int)
+            tasks = [(block.name, values.shape, index_a[start:stop], index_b[start:stop]) for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+            return np.concatenate(self.pool.map(_scan_shared_chunk, tasks))
+        finally:
+            block.close()
+            block.unlink()
+
+    def scan_pending(self):
+        """Test every pair that involves a symbol added since the last scan."""
+        if not self.pending:
+            return
+        first_new = len(self.symbols)
+        self.symbols += self.pending
+        self.pending = []
+
+        # Each new symbol pairs with every symbol loaded before it, oriented like the batch run's sorted columns
+        newer, earlier = np.tril_indices(len(self.symbols), k=-1)
+        newer, earlier = newer[newer >= first_new], earlier[newer >= first_new]
+        names = np.array(self.symbols)
+        swap = names[newer] < names[earlier]
+        index_a, index_b = np.where(swap, newer, earlier), np.where(swap, earlier, newer)
+
+        # Pairs within one timeline group are batched on that group's rows, the rest aligned and tested one by one
+        groups = np.array([self.groups[symbol] for symbol in self.symbols])
+        batched = groups[index_a] == groups[index_b]
+        p_values = np.full(len(index_a), np.nan)
+        for group in np.unique(groups[index_a[batched]]):
+            in_group = batched & (groups[index_a] == group)
+            members = self.members[group]
+            column_of = {symbol: column for column, symbol in enumerate(members)}
+            values = np.column_stack([self.closes[symbol].dropna().to_numpy(dtype=np.float64) for symbol in members])
+            p_values[in_group] = self._batch_p_values(values, np.array([column_of[symbol] for symbol in names[index_a[in_group]]]),
+                                                      np.array([column_of[symbol] for symbol in names[index_b[in_group]]]))
+        for k in np.flatnonzero(~batched):
+            p_values[k] = self._coint(names[index_a[k]], names[index_b[k]])
+
+        self.results.append((names[index_a], names[index_b], p_values))
+
+    def finish(self):
+        """Scan the last symbols, then return the price panel and the passing pairs."""
+        self.scan_pending()
+        tickers = sorted(self.closes)
+        panel = build_price_panel({ticker: self.closes[ticker] for ticker in tickers})
+        if not self.results:
+            return panel, []
+
+        tickers_a, tickers_b, p_values = (np.concatenate(column) for column in zip(*self.results))
+
+        # Report passing pairs in the batch run's pair order
+        position = {ticker: k for k, ticker in enumerate(tickers)}
+        order = np.lexsort(([position[b] for b in tickers_b], [position[a] for a in tickers_a]))
+        passing_pairs = [{"Ax": str(tickers_a[k]), "Bx": str(tickers_b[k]), "p_value": round(float(p_values[k]), 4)}
+                         for k in order if p_values[k] < P_VALUE_THRESHOLD]
+
+        record_items(tickers_loaded=panel.shape[1], candles_loaded=panel.shape[0], pairs_total=len(p_values), pairs_tested=len(p_values),
+                     pairs_passed=len(passing_pairs))
+        return panel, passing_pairs
+
+def _fetch_into_queue(fetch, symbols, timeframe, limit, incremental, ready_queue):
+    """Run the fetch, then mark the end of the stream whether or not it succeeded."""
+    try:
+        fetch(symbols, timeframe, limit, save=not incremental, incremental=incremental, ready_queue=ready_queue)
+    finally:
+        ready_queue.put(None)
+
+def stream_fetch_and_scan(symbols, fetch, timeframe, limit, incremental=False, workers=1, min_rows=MIN_ROWS, store=None):
+    """Fetch candles and run the cointegration scan at the same time, scanning each symbol's pairs once it is stored.
+
+    fetch is fetch_all_candle_data or fetch_all_candle_data_async; it runs on a background thread and reports stored
+    symbols through a queue. Returns the same price panel and passing pairs as fetching everything first, loading the
+    panel and running run_cointegration_analysis, so end-to-end time approaches the longer of the fetch and the scan.
+    """
+    store = store or get_candle_store()
+    ready_queue = queue.Queue()
+
+    # The scan pool is forked before the fetch thread starts, so no child inherits a lock that thread holds, and after
+    # the resource tracker starts, so workers attaching to shared blocks report to the parent's tracker
+    pool = None
+    if workers > 1:
+        resource_tracker.ensure_running()
+        pool = multiprocessing.Pool(processes=workers)
+    scan = StreamingScan(min_rows, pool, workers)
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            fetching = executor.submit(_fetch_into_queue, fetch, symbols, timeframe, limit, incremental, ready_queue)
+            with tqdm(total=len(symbols), desc="Streaming Cointegration", unit="symbol") as progress:
+                streaming = True
+                while streaming:
+                    # Take everything that arrived while the last batch was being scanned
+                    ready = [ready_queue.get()]
+                    while True:
+                        try:
+                            ready.append(ready_queue.get_nowait())
+                        except queue.Empty:
+                            break
+                    if None in ready:
+                        streaming = False
+                        fetch_seconds = time.perf_counter() - started
+                    for symbol in ready:
+                        if symbol is not None:
+                            scan.add(symbol, store.read(symbol))
+                    progress.update(sum(symbol is not None for symbol in ready))
+                    scan.scan_pending()
+            fetching.result()
+        panel, passing_pairs = scan.finish()
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    print(f"Fetch finished after {fetch_seconds:.1f}s; the scan finished {time.perf_counter() - started - fetch_seconds:.1f}s later.")
+    return panel, passing_pairs
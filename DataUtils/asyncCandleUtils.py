@@ -0,0 +1,127 @@
+import asyncio
+import random
+import time
+import ccxt
+import ccxt.async_support as ccxt_async
+from DataUtils.candleUtils import save_candle_data, load_candle_data, incremental_since, merge_and_save_candle_data, discard_stale_candles
+from Instrumentation.stageMetrics import record_items
+
+# Binance request-weight budget per minute and the weight charged for each request we make
+REQUEST_WEIGHT_PER_MINUTE = 6000
+KLINES_REQUEST_WEIGHT = 2
+MARKETS_REQUEST_WEIGHT = 20
+
+# Upper bound on requests in flight at once; the token bucket decides how fast they actually go out
+MAX_CONCURRENT_REQUESTS = 200
+
+# Exponential backoff between retries, with jitter so throttled requests do not retry in lockstep
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 30
+
+# Requests sent by the current event loop run
+_request_counts = {'ohlcv': 0, 'markets': 0}
+
+class TokenBucket:
+    """Token bucket sized to the exchange weight budget, shared by every request in the event loop."""
+
+    def __init__(self, capacity=REQUEST_WEIGHT_PER_MINUTE, refill_per_second=REQUEST_WEIGHT_PER_MINUTE / 60):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self, weight):
+        """Wait until the bucket holds enough tokens for a request of the given weight, then take them."""
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_per_second)
+            self.updated = now
+            if self.tokens >= weight:
+                self.tokens -= weight
+                return
+            await asyncio.sleep((weight - self.tokens) / self.refill_per_second)
+
+def backoff_delay(attempt):
+    """Seconds to wait before the given retry attempt."""
+    return min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+async def fetch_candle_data_async(exchange, bucket, semaphore, symbol, timeframe, limit, since=None, retries=5, check_variability=True):
+    """Fetch OHLCV data for a symbol through the shared async client, within the global weight budget."""
+    symbol_with_usdt = f"{symbol.replace('USDT', '')}/USDT"
+
+    for attempt in range(retries):
+        try:
+            async with semaphore:
+                await bucket.acquire(KLINES_REQUEST_WEIGHT)
+                _request_counts['ohlcv'] += 1
+                ohlcv = await exchange.fetch_ohlcv(symbol_with_usdt, timeframe, limit=limit, since=since)
+
+            if ohlcv:
+                if not check_variability:
+                    return ohlcv
+                # Check for variability in the 'Close' price column
+                close_prices = [row[4] for row in ohlcv]
+                if len(set(close_prices)) > 1:
+                    return ohlcv
+                else:
+                    print(f"Skipping {symbol_with_usdt} due to lack of variability in close prices.")
+                    return None
+
+        except Exception as e:
+            error_message = str(e)
+            if isinstance(e, ccxt.BadSymbol) or "binance does not have market symbol" in error_message:
+                print(f"Error fetching data for {symbol_with_usdt}: {error_message}. Skipping further retries.")
+                return None
+            else:
+                print(f"Error fetching data for {symbol_with_usdt} on attempt {attempt + 1}: {error_message}")
+                await asyncio.sleep(backoff_delay(attempt))
+
+    print(f"Failed to fetch data for {symbol_with_usdt} after {retries} attempts.")
+    return None
+
+async def _fetch_symbol(exchange, bucket, semaphore, symbol, timeframe, limit, since, save, incremental, ready_queue=None):
+    """Fetch one symbol and save it the same way the process-pool fetcher does, then report it on the ready queue."""
+    try:
+        if incremental:
+            stored = load_candle_data(symbol)
+            since = incremental_since(stored, timeframe, limit)
+            ohlcv = await fetch_candle_data_async(exchange, bucket, semaphore, symbol, timeframe, limit, since, check_variability=since is None)
+            if ohlcv:
+                merge_and_save_candle_data(symbol, stored, ohlcv, since, limit)
+            elif stored:
+                discard_stale_candles(symbol)
+            return None
+
+        ohlcv = await fetch_candle_data_async(exchange, bucket, semaphore, symbol, timeframe, limit, since)
+        if save and ohlcv:
+            save_candle_data(symbol, ohlcv)
+            print(f"{symbol} ✅\n")
+        return ohlcv
+    finally:
+        if ready_queue is not None:
+            ready_queue.put(symbol)
+
+async def _fetch_all(symbols, timeframe, limit, since, save, incremental, ready_queue):
+    # Pacing is done by the token bucket, so ccxt's own per-instance throttle is switched off
+    exchange = ccxt_async.binance({'enableRateLimit': False})
+    bucket = TokenBucket()
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    _request_counts.update(ohlcv=0, markets=1)
+    try:
+        await bucket.acquire(MARKETS_REQUEST_WEIGHT)
+        await exchange.load_markets()
+        return await asyncio.gather(*[
+            _fetch_symbol(exchange, bucket, semaphore, symbol, timeframe, limit, since, save, incremental, ready_queue) for symbol in symbols
+        ])
+    finally:
+        await exchange.close()
+
+def fetch_all_candle_data_async(symbols, timeframe, limit, since=None, save=False, incremental=False, ready_queue=None):
+    """Fetch and optionally save time series data for every symbol concurrently on one event loop.
+
+    With a ready_queue, each symbol is put on it as soon as its fetch has finished.
+    """
+    results = asyncio.run(_fetch_all(symbols, timeframe, limit, since, save, incremental, ready_queue))
+    record_items(candle_requests=_request_counts['ohlcv'], markets_requests=_request_counts['markets'], symbols_fetched=len(symbols))
+    if not save and not incremental:
+        return results
@@ -0,0 +1,88 @@
+import os
+import csv
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+# Storage format for candle data, set with CANDLE_STORAGE=csv|npy in .env
+load_dotenv()
+CANDLE_STORAGE = os.getenv('CANDLE_STORAGE', 'csv')
+
+DATA_DIR = 'Binance/Tickers'
+CANDLE_COLUMNS = ['Time', 'Open', 'High', 'Low', 'Close', 'Volume']
+TIME_COLUMN = CANDLE_COLUMNS.index('Time')
+CLOSE_COLUMN = CANDLE_COLUMNS.index('Close')
+
+class CsvCandleStore:
+    """Text CSV candle files, one per symbol, in the original Binance/Tickers layout."""
+    extension = '.csv'
+
+    def __init__(self, directory=DATA_DIR):
+        self.directory = directory
+
+    def path(self, symbol):
+        return os.path.join(self.directory, f"{symbol}{self.extension}")
+
+    def list_symbols(self):
+        """Sorted symbols that have stored candles in this format."""
+        if not os.path.exists(self.directory):
+            return []
+        return sorted(file[:-len(self.extension)] for file in os.listdir(self.directory) if file.endswith(self.extension))
+
+    def exists(self, symbol):
+        return os.path.isfile(self.path(symbol))
+
+    def read(self, symbol):
+        """Return the stored candles as a (bars x 6) float64 array in CANDLE_COLUMNS order, or None."""
+        if not self.exists(symbol):
+            return None
+        df = pd.read_csv(self.path(symbol))
+        if any(column not in df.columns for column in CANDLE_COLUMNS):
+            return None
+        return df[CANDLE_COLUMNS].to_numpy(dtype=np.float64)
+
+    def write(self, symbol, ohlcv):
+        """Replace the stored candles for a symbol with the given OHLCV rows."""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.path(symbol), mode='w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(CANDLE_COLUMNS)
+            writer.writerows(ohlcv)
+
+    def delete(self, symbol):
+        if self.exists(symbol):
+            os.remove(self.path(symbol))
+
+    def clear(self):
+        """Delete every stored candle file in this format."""
+        for symbol in self.list_symbols():
+            self.delete(symbol)
+
+class NpyCandleStore(CsvCandleStore):
+    """Binary float64 .npy candle arrays that readers memory-map instead of parsing."""
+    extension = '.npy'
+
+    def read(self, symbol):
+        if not self.exists(symbol):
+            return None
+        return np.load(self.path(symbol), mmap_mode='r')
+
+    def write(self, symbol, ohlcv):
+        os.makedirs(self.directory, exist_ok=True)
+        # Write then rename, so a reader never memory-maps a half-written file
+        temp_path = self.path(symbol) + '.tmp'
+        with open(temp_path, mode='wb') as file:
+            np.save(file, np.asarray(ohlcv, dtype=np.float64).reshape(-1, len(CANDLE_COLUMNS)))
+        os.replace(temp_path, self.path(symbol))
+
+CANDLE_STORES = {
+    'csv': CsvCandleStore,
+    'npy': NpyCandleStore,
+}
+
+def get_candle_store(storage=None, directory=DATA_DIR):
+    """Return the configured candle storage backend."""
+    storage = storage or CANDLE_STORAGE
+    if storage not in CANDLE_STORES:
+        raise ValueError(f"Unknown candle storage '{storage}'; expected one of {', '.join(CANDLE_STORES)}")
+    return CANDLE_STORES[storage](directory)
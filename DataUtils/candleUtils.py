@@ -4,17 +4,67 @@ import ccxt
 import multiprocessing
 from tqdm import tqdm  # Ensure tqdm is imported
 import time  # For sleep in case of retries
+from DataUtils.candleStore import get_candle_store
+from Instrumentation.stageMetrics import record_items
 
-DATA_DIR = 'Binance/Tickers'
 TICKERS_FILE = 'Binance/binanceActiveTickers.csv'  # Save in the Binance directory
+FETCH_PROCESSES = 8
 
-def clear_existing_csv_files(directory):
-    """Delete all existing CSV files in the specified directory."""
-    if os.path.exists(directory):
-        for file in os.listdir(directory):
-            if file.endswith('.csv'):
-                os.remove(os.path.join(directory, file))
-        print("Cleared existing CSV files.")
+# One exchange client per process with markets loaded once; its HTTP session keeps connections alive between requests
+_exchange = None
+_request_counts = {'ohlcv': 0, 'markets': 0}
+
+def get_exchange():
+    """Return this process's shared Binance client, loading markets the first time it is used."""
+    global _exchange
+    if _exchange is None:
+        exchange = ccxt.binance()
+        _request_counts['markets'] += 1
+        exchange.load_markets()
+        _exchange = exchange
+    return _exchange
+
+def init_fetch_worker():
+    """Give each pool worker its own client rather than the one inherited from the parent process."""
+    global _exchange
+    _exchange = None
+    _request_counts.update(ohlcv=0, markets=0)
+    try:
+        get_exchange()
+    except Exception as e:
+        # Tasks retry loading markets through get_exchange, so the worker must not die here
+        print(f"Error loading markets in fetch worker: {e}")
+
+def _counted_task(task, *args):
+    """Run a fetch task in a pool worker and report the worker's running request counts with its result."""
+    result = task(*args)
+    return result, os.getpid(), dict(_request_counts)
+
+def _counted_symbol_task(task_args):
+    """Run one symbol's fetch task through _counted_task and hand the symbol back with its result."""
+    return task_args[1], _counted_task(*task_args)
+
+def report_saved_requests(counted_results):
+    """Print how many markets requests the shared clients saved compared to loading markets on every attempt."""
+    latest_counts = {pid: counts for _, pid, counts in counted_results}
+    ohlcv_requests = sum(counts['ohlcv'] for counts in latest_counts.values())
+    markets_requests = sum(counts['markets'] for counts in latest_counts.values())
+    print(f"Reused {len(latest_counts)} exchange clients: {ohlcv_requests} candle requests, "
+          f"{markets_requests} markets loads, {ohlcv_requests - markets_requests} markets requests saved.")
+    record_items(candle_requests=ohlcv_requests, markets_requests=markets_requests)
+
+def clear_stored_candles():
+    """Delete all stored candle files in the configured storage format."""
+    get_candle_store().clear()
+    print("Cleared existing candle files.")
+
+def prune_stale_candles(symbols):
+    """Delete stored candles for symbols that are no longer in the active ticker list."""
+    store = get_candle_store()
+    active = set(symbols)
+    for symbol in store.list_symbols():
+        if symbol not in active:
+            store.delete(symbol)
 
 def save_symbols_to_csv(symbols):
     """Save list of ticker symbols to CSV in the Binance directory."""
@@ -26,17 +76,19 @@ def save_symbols_to_csv(symbols):
             writer.writerow([symbol])
     print("Active tickers CSV regenerated in the Binance directory.")
 
-def fetch_candle_data(symbol, timeframe, limit, since=None, retries=3):
+def fetch_candle_data(symbol, timeframe, limit, since=None, retries=3, check_variability=True):
     """Fetch OHLCV data for a given symbol in the futures market and return it."""
-    exchange = ccxt.binance()
     symbol_with_usdt = f"{symbol.replace('USDT', '')}/USDT"
 
     for attempt in range(retries):
         try:
-            exchange.load_markets()
+            exchange = get_exchange()
+            _request_counts['ohlcv'] += 1
             ohlcv = exchange.fetch_ohlcv(symbol_with_usdt, timeframe, limit=limit, since=since)
 
             if ohlcv:
+                if not check_variability:
+                    return ohlcv
                 # Check for variability in the 'Close' price column
                 close_prices = [row[4] for row in ohlcv]  # Close price is the 5th element in each row
                 if len(set(close_prices)) > 1:  # Proceed if there is more than one unique close price
@@ -58,13 +110,61 @@ def fetch_candle_data(symbol, timeframe, limit, since=None, retries=3):
     return None
 
 def save_candle_data(symbol, ohlcv):
-    """Save OHLCV data to a CSV file for the given symbol."""
-    filename = os.path.join(DATA_DIR, f"{symbol}.csv")
+    """Save OHLCV data for the given symbol through the configured candle store."""
+    if ohlcv:
+        get_candle_store().write(symbol, ohlcv)
+
+def load_candle_data(symbol):
+    """Load the stored OHLCV rows for a symbol, or an empty list if it has no data yet."""
+    candles = get_candle_store().read(symbol)
+    if candles is None:
+        return []
+    return [[int(row[0])] + [float(value) for value in row[1:]] for row in candles]
+
+def incremental_since(stored, timeframe, limit):
+    """Timestamp to resume fetching from, or None when the stored window is missing or too old to top up."""
+    if not stored:
+        return None
+    # Re-fetch from the last stored candle, which may have been saved while still open
+    timeframe_ms = ccxt.Exchange.parse_timeframe(timeframe) * 1000
+    missing_bars = (int(time.time() * 1000) - stored[-1][0]) // timeframe_ms
+    return stored[-1][0] if missing_bars < limit else None
+
+def discard_stale_candles(symbol):
+    """Delete a symbol's stored candles after its update failed to land.
+
+    The old window would end a bar behind every other symbol's, so the symbol sits this run out and is fetched in full
+    on the next one.
+    """
+    store = get_candle_store()
+    if store.exists(symbol):
+        store.delete(symbol)
+        print(f"Discarded stored candles for {symbol}; its update did not land.")
+
+def merge_and_save_candle_data(symbol, stored, ohlcv, since, limit):
+    """Append freshly fetched candles to the stored ones, trim the window to limit and save it."""
+    if since is not None:
+        ohlcv = [row for row in stored if row[0] < ohlcv[0][0]] + ohlcv
+    ohlcv = ohlcv[-limit:]
+
+    if len(set(row[4] for row in ohlcv)) > 1:
+        save_candle_data(symbol, ohlcv)
+        print(f"{symbol} ✅\n")
+    else:
+        print(f"Skipping {symbol} due to lack of variability in close prices.")
+        discard_stale_candles(symbol)
+
+def update_candle_data(symbol, timeframe, limit):
+    """Fetch only the candles after the last stored one, append them and trim the window to limit."""
+    stored = load_candle_data(symbol)
+    since = incremental_since(stored, timeframe, limit)
+
+    # Variability is checked on the merged window rather than on the few new candles
+    ohlcv = fetch_candle_data(symbol, timeframe, limit, since, check_variability=since is None)
     if ohlcv:
-        with open(filename, mode='w', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow(['Time', 'Open', 'High', 'Low', 'Close', 'Volume'])
-            writer.writerows(ohlcv)
+        merge_and_save_candle_data(symbol, stored, ohlcv, since, limit)
+    elif stored:
+        discard_stale_candles(symbol)
 
 def fetch_and_save_candle_data(symbol, timeframe, limit, since=None):
     """Fetch and save OHLCV data for a given symbol."""
@@ -73,11 +173,29 @@ def fetch_and_save_candle_data(symbol, timeframe, limit, since=None):
         save_candle_data(symbol, ohlcv)
         print(f"{symbol} ✅\n")
 
-def fetch_all_candle_data(symbols, timeframe, limit, since=None, save=False):
-    """Fetch and optionally save time series data."""
-    with multiprocessing.Pool(processes=8) as pool:
-        if save:
-            pool.starmap(fetch_and_save_candle_data, [(symbol, timeframe, limit, since) for symbol in symbols])
+def fetch_all_candle_data(symbols, timeframe, limit, since=None, save=False, incremental=False, ready_queue=None):
+    """Fetch and optionally save time series data.
+
+    With a ready_queue, each symbol is put on it as soon as its fetch has finished, so a consumer can start on the
+    stored candles while the rest are still downloading.
+    """
+    if incremental:
+        tasks = [(update_candle_data, symbol, timeframe, limit) for symbol in symbols]
+    elif save:
+        tasks = [(fetch_and_save_candle_data, symbol, timeframe, limit, since) for symbol in symbols]
+    else:
+        tasks = [(fetch_candle_data, symbol, timeframe, limit, since) for symbol in symbols]
+
+    with multiprocessing.Pool(processes=FETCH_PROCESSES, initializer=init_fetch_worker) as pool:
+        if ready_queue is None:
+            results = pool.starmap(_counted_task, tasks)
         else:
-            results = pool.starmap(fetch_candle_data, [(symbol, timeframe, limit, since) for symbol in symbols])
-            return results
+            results = []
+            for symbol, result in pool.imap_unordered(_counted_symbol_task, tasks):
+                results.append(result)
+                ready_queue.put(symbol)
+
+    report_saved_requests(results)
+    record_items(symbols_fetched=len(symbols))
+    if not save and not incremental:
+        return [ohlcv for ohlcv, _, _ in results]
@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+from DataUtils.candleStore import get_candle_store, TIME_COLUMN, CLOSE_COLUMN
+
+MIN_ROWS = 1000
+
+def load_price_panel(store=None, min_rows=MIN_ROWS):
+    """Read every ticker once into a timestamp-aligned matrix of close prices, one column per symbol."""
+    store = store or get_candle_store()
+    closes = {}
+    for symbol in store.list_symbols():
+        candles = store.read(symbol)
+
+        # Only keep tickers with at least min_rows candles
+        if candles is None or len(candles) < min_rows:
+            continue
+        closes[symbol] = close_series(candles)
+    return build_price_panel(closes)
+
+def close_series(candles):
+    """Close prices of a (bars x 6) candle array indexed by candle timestamp."""
+    return pd.Series(candles[:, CLOSE_COLUMN], index=candles[:, TIME_COLUMN].astype('int64'))
+
+def build_price_panel(closes):
+    """Join close series, keyed by symbol in column order, into the price panel."""
+    # Outer join on the candle timestamps; pairs drop their own missing rows when sliced
+    panel = pd.DataFrame(closes).sort_index()
+    panel.index.name = 'Time'
+    print(f"Loaded {panel.shape[1]} tickers x {panel.shape[0]} candles into the price panel.")
+    return panel
+
+def get_pair_series(panel, ticker_a, ticker_b):
+    """Slice the aligned close series for two tickers, keeping only timestamps both have."""
+    aligned_data = panel[[ticker_a, ticker_b]].dropna()
+    return aligned_data[ticker_a], aligned_data[ticker_b]
+
+def timeline_groups(values):
+    """Group tickers of a (bars x tickers) price matrix by the exact set of timestamps they have prices at.
+
+    Returns the matrix's non-NaN mask and a group id per column. A pair within one group aligns on that group's rows
+    with no per-pair join, so one ticker with a shifted window only moves its own pairs off the batch path.
+    """
+    observed = ~np.isnan(values)
+    _, groups = np.unique(observed.T, axis=0, return_inverse=True)
+    return observed, groups.ravel()
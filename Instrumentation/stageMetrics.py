@@ -0,0 +1,182 @@
+import os
+import io
+import json
+import time
+import pstats
+import cProfile
+import resource
+import threading
+from datetime import datetime
+from contextlib import contextmanager
+
+METRICS_DIR = 'Instrumentation/Runs'
+
+# Stages of the hourly job, in order; any of them can be profiled with --profile
+PIPELINE_STAGES = ['symbols', 'fetch', 'stream', 'price_panel', 'cointegration', 'rolling', 'zscore', 'signals', 'charts']
+
+# Runs longer than this overlap the next scheduled run
+RUN_BUDGET_SECONDS = 3600
+
+# Functions listed from a stage profile, by cumulative time
+PROFILE_TOP_FUNCTIONS = 25
+
+# Seconds between samples of pool workers' resident memory while a stage runs
+RSS_SAMPLE_SECONDS = 0.05
+
+# The run being recorded, and the items counted so far by the stage in progress
+_run = None
+_stage_items = None
+
+def start_run(profile_stage=None):
+    """Begin a metrics log for one run of the job, optionally profiling one of its stages."""
+    global _run
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    run_id = datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
+    _reset_peak_rss()
+    _run = {
+        'run_id': run_id,
+        'path': os.path.join(METRICS_DIR, f"{run_id}.jsonl"),
+        'profile_stage': profile_stage,
+        'started': time.perf_counter(),
+        'peak_rss_kb': 0,
+    }
+
+def finish_run():
+    """Record the run's total wall time and warn when it overran the hourly budget."""
+    global _run
+    if _run is None:
+        return
+    wall_seconds = time.perf_counter() - _run['started']
+    _note_run_peak_rss()
+    _write({'stage': 'total', 'wall_seconds': round(wall_seconds, 3), 'peak_rss_mb': _to_mb(_run['peak_rss_kb'] or None),
+            'overran': wall_seconds > RUN_BUDGET_SECONDS})
+    if wall_seconds > RUN_BUDGET_SECONDS:
+        print(f"Warning: run took {wall_seconds / 60:.1f} minutes, longer than the {RUN_BUDGET_SECONDS // 60}-minute schedule.")
+    print(f"Stage metrics saved to {_run['path']}")
+    _run = None
+
+def record_items(**items):
+    """Add item counts (pairs tested, requests made, ...) to the stage in progress; ignored outside a stage."""
+    if _stage_items is not None:
+        for name, count in items.items():
+            _stage_items[name] = _stage_items.get(name, 0) + int(count)
+
+def _to_mb(kilobytes):
+    return None if kilobytes is None else round(kilobytes / 1024, 1)
+
+def _status_kb(pid, field):
+    """A memory field of /proc/<pid>/status in kB, or None without /proc or once the process has exited."""
+    try:
+        with open(f"/proc/{pid}/status") as file:
+            for line in file:
+                if line.startswith(f"{field}:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+def _reset_peak_rss():
+    """Reset this process's peak RSS (VmHWM) so the next reading covers only what follows; False where unsupported."""
+    try:
+        with open('/proc/self/clear_refs', mode='w') as file:
+            file.write('5')
+        return True
+    except OSError:
+        return False
+
+def _note_run_peak_rss():
+    """Fold the peak RSS since the last reset into the run's peak, before it is reset again."""
+    if _run is not None:
+        _run['peak_rss_kb'] = max(_run['peak_rss_kb'], _status_kb('self', 'VmHWM') or 0)
+
+def _child_pids():
+    """Pids of this process's live children."""
+    pids = []
+    try:
+        for task in os.listdir('/proc/self/task'):
+            with open(f"/proc/self/task/{task}/children") as file:
+                pids.extend(file.read().split())
+    except OSError:
+        pass
+    return pids
+
+class _WorkerRssSampler(threading.Thread):
+    """Largest resident set of any child process while a stage runs, sampled from /proc every RSS_SAMPLE_SECONDS.
+
+    ru_maxrss for children only covers children already waited for, over the whole process lifetime, so pool workers
+    are sampled instead; workers living shorter than one interval can be missed.
+    """
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.stopping = threading.Event()
+        self.peak_kb = 0
+
+    def run(self):
+        while True:
+            for pid in _child_pids():
+                self.peak_kb = max(self.peak_kb, _status_kb(pid, 'VmRSS') or 0)
+            if self.stopping.wait(RSS_SAMPLE_SECONDS):
+                return
+
+    def stop(self):
+        """Stop sampling and return the peak in kB."""
+        self.stopping.set()
+        self.join()
+        return self.peak_kb
+
+def _write(record):
+    with open(_run['path'], mode='a') as file:
+        file.write(json.dumps({'run_id': _run['run_id'], **record}) + '\n')
+
+@contextmanager
+def stage(name):
+    """Measure one pipeline stage: wall time, CPU time in this process and in finished pool workers, peak RSS and item counts."""
+    global _stage_items
+    _stage_items = {}
+    profiler = cProfile.Profile() if _run is not None and _run['profile_stage'] == name else None
+
+    # Peak RSS is reset at entry so it covers this stage alone, not the lifetime of a long-running scheduler
+    _note_run_peak_rss()
+    peak_reset = _reset_peak_rss()
+    worker_sampler = _WorkerRssSampler()
+    worker_sampler.start()
+
+    started_at = datetime.now().isoformat(timespec='seconds')
+    wall_started = time.perf_counter()
+    cpu_started = time.process_time()
+    children_started = resource.getrusage(resource.RUSAGE_CHILDREN)
+    if profiler:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler:
+            profiler.disable()
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        worker_peak_kb = worker_sampler.stop()
+        _note_run_peak_rss()
+        record = {
+            'stage': name,
+            'started_at': started_at,
+            'wall_seconds': round(time.perf_counter() - wall_started, 3),
+            'cpu_seconds': round(time.process_time() - cpu_started, 3),
+            'worker_cpu_seconds': round(max(0.0, children.ru_utime + children.ru_stime - children_started.ru_utime - children_started.ru_stime), 3),
+            'peak_rss_mb': _to_mb(_status_kb('self', 'VmHWM')) if peak_reset else None,
+            'worker_peak_rss_mb': _to_mb(worker_peak_kb) if os.path.isdir('/proc/self/task') else None,
+            **_stage_items,
+        }
+        _stage_items = None
+        if _run is not None:
+            _write(record)
+            if profiler:
+                _save_profile(profiler, name)
+
+def _save_profile(profiler, name):
+    """Dump a stage's profile next to the metrics log and print its most expensive functions."""
+    profile_path = os.path.join(METRICS_DIR, f"{_run['run_id']}-{name}.prof")
+    profiler.dump_stats(profile_path)
+    summary = io.StringIO()
+    pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(PROFILE_TOP_FUNCTIONS)
+    print(summary.getvalue())
+    print(f"Profile of the {name} stage saved to {profile_path}")
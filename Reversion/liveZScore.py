@@ -0,0 +1,143 @@
+import numpy as np
+from DataUtils.pricePanel import get_pair_series
+from Reversion.zScore import Z_SCORE_MIN, Z_SCORE_MAX
+
+# Hourly bars kept per pair, matching the window fetched by the hourly job
+STREAM_WINDOW = 1000
+
+MS_PER_HOUR = 3600 * 1000
+
+class LiveZScore:
+    """Spread Z-scores over a rolling window of hourly bars, updated in O(1) per affected pair on every price tick.
+
+    Each pair keeps a ring buffer of its log-price spread plus a running sum and sum of squares. A tick inside the
+    current hour replaces the pair's last bar and a tick in a new hour appends one and drops the oldest. Either way
+    the mean and standard deviation (ddof=1) follow from the sums without touching the rest of the window.
+    """
+
+    def __init__(self, pairs, window=STREAM_WINDOW):
+        self.pairs = pairs
+        self.window = window
+        self.symbols = sorted({ticker for pair in pairs for ticker in (pair['Ax'], pair['Bx'])})
+        self.column = {symbol: k for k, symbol in enumerate(self.symbols)}
+        self.index_a = np.array([self.column[pair['Ax']] for pair in pairs], dtype=int)
+        self.index_b = np.array([self.column[pair['Bx']] for pair in pairs], dtype=int)
+
+        # Pairs touched by each symbol, so a tick only updates the spreads it moves
+        self.pairs_by_symbol = {symbol: np.flatnonzero((self.index_a == k) | (self.index_b == k)).tolist()
+                                for k, symbol in enumerate(self.symbols)}
+
+        n_pairs = len(pairs)
+        self.closes = np.full(len(self.symbols), np.nan)
+        self.spreads = np.zeros((n_pairs, window))  # Ring buffer of spreads, shifted by each pair's first seeded spread
+        self.shift = np.zeros(n_pairs)
+        self.counts = np.zeros(n_pairs, dtype=int)
+        self.last_slot = np.full(n_pairs, -1)
+        self.bar_time = np.full(n_pairs, -1, dtype=np.int64)
+        self.sums = np.zeros(n_pairs)
+        self.squares = np.zeros(n_pairs)
+        self.updates = np.zeros(n_pairs, dtype=int)
+        self.in_band = np.zeros(n_pairs, dtype=bool)
+
+    def seed(self, panel):
+        """Fill every pair's window with the stored hourly closes, so the stream starts from a full history."""
+        for symbol, k in self.column.items():
+            if symbol in panel.columns:
+                closes = panel[symbol].dropna()
+                if len(closes):
+                    self.closes[k] = closes.iloc[-1]
+
+        for k, pair in enumerate(self.pairs):
+            if pair['Ax'] not in panel.columns or pair['Bx'] not in panel.columns:
+                continue
+            aligned_data_a, aligned_data_b = get_pair_series(panel, pair['Ax'], pair['Bx'])
+            spread = np.log(aligned_data_a / aligned_data_b).iloc[-self.window:]
+            if not len(spread):
+                continue
+            self.shift[k] = spread.iloc[0]
+            self.counts[k] = len(spread)
+            self.spreads[k, :len(spread)] = spread.to_numpy() - self.shift[k]
+            self.last_slot[k] = len(spread) - 1
+            self.bar_time[k] = spread.index[-1]
+            self._recompute(k)
+
+            # Pairs already inside the band were reported by the hourly run; only fresh entries are signalled
+            z_score = self.z_score(k)
+            self.in_band[k] = Z_SCORE_MIN <= abs(z_score) <= Z_SCORE_MAX
+
+    def _recompute(self, k):
+        """Rebuild a pair's running sums exactly from its window, bounding floating-point drift."""
+        values = self.spreads[k, :self.counts[k]]
+        self.sums[k] = values.sum()
+        self.squares[k] = (values * values).sum()
+        self.updates[k] = 0
+
+    def z_score(self, k):
+        """Z-score of the latest bar of pair k against its window."""
+        n = self.counts[k]
+        if n < 2:
+            return np.nan
+        mean = self.sums[k] / n
+        variance = (self.squares[k] - self.sums[k] * mean) / (n - 1)
+        if variance <= 0:
+            return np.nan
+        return (self.spreads[k, self.last_slot[k]] - mean) / np.sqrt(variance)
+
+    def update(self, symbol, timestamp, close):
+        """Apply a price tick for a symbol and return the signals for pairs that just entered the entry band."""
+        symbol_index = self.column.get(symbol)
+        if symbol_index is None:
+            return []
+        self.closes[symbol_index] = close
+        bar = timestamp - timestamp % MS_PER_HOUR
+
+        signals = []
+        for k in self.pairs_by_symbol[symbol]:
+            # Late ticks for an hour this pair has already rolled past are dropped
+            if bar < self.bar_time[k]:
+                continue
+            price_ratio = self.closes[self.index_a[k]] / self.closes[self.index_b[k]]
+            if not np.isfinite(price_ratio) or price_ratio <= 0:
+                continue
+            spread = np.log(price_ratio) - self.shift[k]
+
+            if bar == self.bar_time[k]:
+                # Same hour: the tick replaces the forming bar
+                slot = self.last_slot[k]
+                previous = self.spreads[k, slot]
+                self.sums[k] += spread - previous
+                self.squares[k] += spread * spread - previous * previous
+            else:
+                # New hour: append a bar, dropping the oldest once the window is full
+                slot = (self.last_slot[k] + 1) % self.window
+                if self.counts[k] == self.window:
+                    oldest = self.spreads[k, slot]
+                    self.sums[k] -= oldest
+                    self.squares[k] -= oldest * oldest
+                else:
+                    self.counts[k] += 1
+                self.sums[k] += spread
+                self.squares[k] += spread * spread
+                self.last_slot[k] = slot
+                self.bar_time[k] = bar
+            self.spreads[k, slot] = spread
+
+            self.updates[k] += 1
+            if self.updates[k] >= self.window:
+                self._recompute(k)
+
+            z_score = self.z_score(k)
+            entered = Z_SCORE_MIN <= abs(z_score) <= Z_SCORE_MAX
+            if entered and not self.in_band[k]:
+                signals.append({
+                    "Ax": self.pairs[k]['Ax'],
+                    "Bx": self.pairs[k]['Bx'],
+                    "Z_score": round(float(z_score), 2),
+                    "side": "long" if z_score < 0 else "short",
+                    "mean_reversion_ratio": round(float(np.exp(self.sums[k] / self.counts[k] + self.shift[k])), 5),
+                    "trade_price_ratio": round(float(price_ratio), 5),
+                    "time": int(bar),
+                })
+            self.in_band[k] = entered
+
+        return signals
@@ -1,17 +1,19 @@
 import os
+import multiprocessing
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib
 from statsmodels.regression.linear_model import OLS
 from statsmodels.tools.tools import add_constant
-from scipy.fft import fft, fftfreq
+from scipy.fft import fft, fftfreq, rfft, irfft, next_fast_len
 from tqdm import tqdm  # For progress bar
+from DataUtils.pricePanel import load_price_panel, get_pair_series, timeline_groups
+from Instrumentation.stageMetrics import record_items
 
 # Use the non-interactive Agg backend
 matplotlib.use('Agg')
 
-TICKERS_DIR = 'Binance/Tickers'
 CHARTS_DIR = 'StatsDisplay/SignalCharts'
 
 # Thresholds for determining cyclical behavior
@@ -19,28 +21,61 @@ AUTO_CORRELATION_THRESHOLD = 0.1
 FREQUENCY_THRESHOLD = 0.7
 LAG_INTERVAL = 24
 
+# Entry band for the absolute Z-score of the latest bar, and the longest half-life accepted
+Z_SCORE_MIN = 1.2
+Z_SCORE_MAX = 2.5
+MAX_HALF_LIFE = 24
+
 # ATR threshold to filter out volatile pairs
 # ATR_THRESHOLD = 0.5  # Example threshold, adjust based on your criteria
 
-def load_data(file_path):
-    """Load CSV data into a pandas DataFrame."""
-    df = pd.read_csv(file_path)
-    return df['Close'] if 'Close' in df.columns else None
-
-def align_data(df1, df2):
-    """Align two DataFrames based on their timestamps."""
-    aligned_data = pd.concat([df1, df2], axis=1, join='inner')
-    return aligned_data.iloc[:, 0], aligned_data.iloc[:, 1]
-
 def calculate_zscore(series):
     """Calculate the Z-score for a series."""
     return (series - series.mean()) / series.std()
 
+def autocorrelation(z_scores, max_lag):
+    """Autocorrelation at lags 1..max_lag, computed like pandas' Series.autocorr, for a series or each row of a 2-D array.
+
+    All lagged cross-products come from one FFT pass; the per-lag means and variances come from cumulative sums.
+    """
+    values = np.atleast_2d(np.asarray(z_scores, dtype=np.float64))
+    n = values.shape[1]
+    lags = np.arange(1, max_lag + 1)
+    counts = n - lags
+
+    size = next_fast_len(2 * n - 1, real=True)
+    spectrum = rfft(values, n=size, axis=1)
+    cross_products = irfft(spectrum * np.conj(spectrum), n=size, axis=1)[:, 1:max_lag + 1]
+
+    sums = np.concatenate([np.zeros((len(values), 1)), np.cumsum(values, axis=1)], axis=1)
+    squares = np.concatenate([np.zeros((len(values), 1)), np.cumsum(values * values, axis=1)], axis=1)
+    head_sum, tail_sum = sums[:, n - lags], sums[:, [n]] - sums[:, lags]
+    head_squares, tail_squares = squares[:, n - lags], squares[:, [n]] - squares[:, lags]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        covariance = cross_products - head_sum * tail_sum / counts
+        head_variance = head_squares - head_sum * head_sum / counts
+        tail_variance = tail_squares - tail_sum * tail_sum / counts
+        autocorr_values = covariance / np.sqrt(head_variance * tail_variance)
+
+    return autocorr_values[0] if np.ndim(z_scores) == 1 else autocorr_values
+
 def check_periodic_autocorrelation(z_scores, threshold=AUTO_CORRELATION_THRESHOLD, lag_interval=LAG_INTERVAL):
-    """Check if a Z-score series has periodic autocorrelation peaks."""
-    autocorr_values = [pd.Series(z_scores).autocorr(lag=i) for i in range(1, len(z_scores) // 2)]
-    periodic_peaks = [i for i, ac in enumerate(autocorr_values) if abs(ac) > threshold]
-    return any(np.diff(periodic_peaks) == lag_interval)
+    """Check if a Z-score series (or each row of a 2-D array) has periodic autocorrelation peaks."""
+    autocorr_values = autocorrelation(z_scores, np.shape(z_scores)[-1] // 2 - 1)
+    periodic = has_periodic_peaks(np.atleast_2d(autocorr_values), threshold, lag_interval)
+    return bool(periodic[0]) if np.ndim(z_scores) == 1 else periodic
+
+def has_periodic_peaks(autocorr_values, threshold=AUTO_CORRELATION_THRESHOLD, lag_interval=LAG_INTERVAL):
+    """Mask of the rows of a 2-D autocorrelation array where consecutive peaks sit exactly lag_interval lags apart."""
+    with np.errstate(invalid='ignore'):
+        peaks = np.abs(autocorr_values) > threshold
+
+    # Distance from each peak to the next one, via a reversed running minimum of peak positions
+    positions = np.arange(peaks.shape[1])
+    no_peak = 2 * peaks.shape[1] + lag_interval  # Sentinel far enough away never to look like a periodic gap
+    next_peak = np.minimum.accumulate(np.where(peaks, positions, no_peak)[:, ::-1], axis=1)[:, ::-1]
+    return (peaks[:, :-1] & (next_peak[:, 1:] - positions[:-1] == lag_interval)).any(axis=1)
 
 def check_dominant_frequency(z_scores, frequency_threshold=FREQUENCY_THRESHOLD):
     """Check if a Z-score series has a dominant frequency indicating cyclical behavior."""
@@ -78,23 +113,65 @@ def clear_charts_directory():
     else:
         os.makedirs(CHARTS_DIR)
 
-def chart_zscore(pair_name, z_scores):
-    """Generate a Z-score chart for pairs meeting all criteria."""
-    plt.style.use('dark_background')
-    plt.figure(figsize=(10, 5))
+# Figure and Z-score line reused by every chart drawn in this process
+_chart_figure = None
+_chart_line = None
 
-    plt.plot(z_scores, label='Z-score')
-    plt.axhline(2, color='red', linestyle='--', label='Z = 2')
-    plt.axhline(-2, color='green', linestyle='--', label='Z = -2')
-    plt.axhline(0, color='white', linestyle='-', label='Z = 0')
+def _get_chart_figure():
+    """Build the styled Z-score figure once per process; later charts only swap the line data and title."""
+    global _chart_figure, _chart_line
+    if _chart_figure is None:
+        plt.style.use('dark_background')
+        _chart_figure = plt.figure(figsize=(10, 5))
+        axes = _chart_figure.gca()
 
-    plt.title(f'Z-Score for {pair_name}', fontsize=14)
-    plt.xlabel('Time', fontsize=12)
-    plt.ylabel('Z-Score', fontsize=12)
-    plt.legend()
+        _chart_line, = axes.plot([], [], label='Z-score')
+        axes.axhline(2, color='red', linestyle='--', label='Z = 2')
+        axes.axhline(-2, color='green', linestyle='--', label='Z = -2')
+        axes.axhline(0, color='white', linestyle='-', label='Z = 0')
 
-    plt.savefig(os.path.join(CHARTS_DIR, f"{pair_name}.png"))
-    plt.close()
+        axes.set_xlabel('Time', fontsize=12)
+        axes.set_ylabel('Z-Score', fontsize=12)
+        axes.legend()
+    return _chart_figure, _chart_line
+
+def chart_zscore(pair_name, z_scores):
+    """Generate a Z-score chart for pairs meeting all criteria."""
+    figure, line = _get_chart_figure()
+    axes = figure.gca()
+
+    line.set_data(np.arange(len(z_scores)), np.asarray(z_scores))
+    axes.relim()
+    axes.autoscale_view()
+    axes.set_title(f'Z-Score for {pair_name}', fontsize=14)
+
+    figure.savefig(os.path.join(CHARTS_DIR, f"{pair_name}.png"))
+
+def _chart_task(task):
+    pair_name, z_scores = task
+    chart_zscore(pair_name, z_scores)
+
+def render_signal_charts(zscore_results, panel, workers=1, top_k=None):
+    """Render Z-score charts for signal pairs after the signals are written, optionally only the top_k by |Z|."""
+    ranked = sorted(zscore_results, key=lambda result: abs(result['Z_score']), reverse=True)
+    if top_k is not None:
+        ranked = ranked[:top_k]
+    if not ranked:
+        return
+    record_items(charts_rendered=len(ranked))
+
+    tasks = []
+    for result in ranked:
+        aligned_data_a, aligned_data_b = get_pair_series(panel, result['Ax'], result['Bx'])
+        z_scores = calculate_zscore(np.log(aligned_data_a / aligned_data_b))
+        tasks.append((f"{result['Ax']}_{result['Bx']}", z_scores.to_numpy()))
+
+    if workers <= 1:
+        for task in tqdm(tasks, desc="Rendering Signal Charts"):
+            _chart_task(task)
+    else:
+        with multiprocessing.Pool(processes=workers, initializer=_get_chart_figure) as pool:
+            list(tqdm(pool.imap_unordered(_chart_task, tasks), total=len(tasks), desc="Rendering Signal Charts"))
 
 def calculate_atr(prices, period=14):
     """Calculate the Average True Range (ATR) for a given period."""
@@ -110,63 +187,120 @@ def calculate_atr(prices, period=14):
     atr = true_range.rolling(window=period).mean()
     return atr
 
-def run_zscore_analysis(passing_pairs):
-    """Run Z-score and half-life analysis on pairs meeting p-value criteria."""
-    results = []
-    for pair in tqdm(passing_pairs, desc="Calculating Z-Scores and Half-Lives"):
-        file_a = os.path.join(TICKERS_DIR, f"{pair['Ax']}.csv")
-        file_b = os.path.join(TICKERS_DIR, f"{pair['Bx']}.csv")
-        data_a = load_data(file_a)
-        data_b = load_data(file_b)
-
-        aligned_data_a, aligned_data_b = align_data(data_a, data_b)
-
-        spread = np.log(aligned_data_a / aligned_data_b)
-        z_scores = calculate_zscore(spread)
-        last_z_score = abs(z_scores.iloc[-1])
-
-        # Modify the condition to only allow z-scores between 1.2 and 2.5
-        if last_z_score < 1.2 or last_z_score > 2.5:
-            continue
-
-        # Calculate ATR for the pairs
-        combined_data = pd.DataFrame({
-            'High': np.maximum(aligned_data_a, aligned_data_b),
-            'Low': np.minimum(aligned_data_a, aligned_data_b),
-            'Close': aligned_data_a  # or aligned_data_b based on your preference
-        })
-        # atr = calculate_atr(combined_data)
+def calculate_half_lives(spreads):
+    """Half-lives for every column of a spread matrix, using the same regression as calculate_half_life in closed form."""
+    lagged = np.vstack([np.zeros((1, spreads.shape[1])), spreads[:-1]])
+    returns = spreads - lagged
+    lagged_centered = lagged - lagged.mean(axis=0)
+    slope = (lagged_centered * (returns - returns.mean(axis=0))).sum(axis=0) / (lagged_centered * lagged_centered).sum(axis=0)
+
+    with np.errstate(divide='ignore'):
+        half_lives = -np.log(2) / slope
+    # NaN marks the pairs calculate_half_life would return None for
+    return np.where(np.isclose(slope, 0, atol=1e-8) | ~(half_lives > 0), np.nan, np.round(half_lives, 2))
+
+def _analyze_pair(pair, panel):
+    """Per-pair Z-score and half-life analysis, for pairs whose legs do not share the full panel timeline."""
+    aligned_data_a, aligned_data_b = get_pair_series(panel, pair['Ax'], pair['Bx'])
 
-        # # Filter out pairs that are too volatile based on ATR
-        # if atr.iloc[-1] > ATR_THRESHOLD:
-        #     continue
+    spread = np.log(aligned_data_a / aligned_data_b)
+    z_scores = calculate_zscore(spread)
+    last_z_score = abs(z_scores.iloc[-1])
+
+    # Modify the condition to only allow z-scores between 1.2 and 2.5
+    if last_z_score < Z_SCORE_MIN or last_z_score > Z_SCORE_MAX:
+        return None
 
-        half_life = calculate_half_life(spread)
-        if half_life is None or half_life > 24:
-            continue
+    # Calculate ATR for the pairs
+    combined_data = pd.DataFrame({
+        'High': np.maximum(aligned_data_a, aligned_data_b),
+        'Low': np.minimum(aligned_data_a, aligned_data_b),
+        'Close': aligned_data_a  # or aligned_data_b based on your preference
+    })
+    # atr = calculate_atr(combined_data)
 
-        has_dominant_frequency = (
-            1 if check_periodic_autocorrelation(z_scores) else 0
-        )
+    # # Filter out pairs that are too volatile based on ATR
+    # if atr.iloc[-1] > ATR_THRESHOLD:
+    #     return None
+
+    half_life = calculate_half_life(spread)
+    if half_life is None or half_life > MAX_HALF_LIFE:
+        return None
+
+    # Skip pairs without a dominant frequency
+    if not check_periodic_autocorrelation(z_scores):
+        return None
 
-        # Skip pairs without a dominant frequency
-        if has_dominant_frequency == 0:
-            continue
+    return round(z_scores.iloc[-1], 2), half_life, round(np.exp(spread.mean()), 5)
 
-        spread_mean = spread.mean()
-        mean_reversion_ratio = round(np.exp(spread_mean), 5)
+def batch_reversion_stats(values, index_a, index_b, z_min=Z_SCORE_MIN, z_max=Z_SCORE_MAX, max_half_life=MAX_HALF_LIFE):
+    """Spreads, Z-scores, half-lives and mean reversion ratios for many pairs of a gap-free price matrix at once.
+
+    Returns the (bars x pairs) Z-score matrix and a mask of the pairs passing every filter in run_zscore_analysis,
+    along with their rounded last Z-score, half-life and mean reversion ratio.
+    """
+    spreads = np.log(values[:, index_a] / values[:, index_b])
+    spread_means = spreads.mean(axis=0)
+    z_scores = (spreads - spread_means) / spreads.std(axis=0, ddof=1)
+    last_z_scores = z_scores[-1]
+
+    # Only allow z-scores between 1.2 and 2.5, then apply the costlier filters to the survivors
+    passing = (np.abs(last_z_scores) >= z_min) & (np.abs(last_z_scores) <= z_max)
+    half_lives = np.full(len(index_a), np.nan)
+    half_lives[passing] = calculate_half_lives(spreads[:, passing])
+    passing &= half_lives <= max_half_life
+    if passing.any():
+        passing[passing] = check_periodic_autocorrelation(z_scores[:, passing].T)
+
+    return z_scores, passing, np.round(last_z_scores, 2), half_lives, np.round(np.exp(spread_means), 5)
+
+def run_zscore_analysis(passing_pairs, panel=None):
+    """Run Z-score and half-life analysis on pairs meeting p-value criteria."""
+    if not passing_pairs:
+        return []
+    if panel is None:
+        panel = load_price_panel()
+
+    column = {ticker: k for k, ticker in enumerate(panel.columns)}
+    index_a = np.array([column[pair['Ax']] for pair in passing_pairs], dtype=int)
+    index_b = np.array([column[pair['Bx']] for pair in passing_pairs], dtype=int)
+
+    # Pairs whose tickers share a timeline are analysed together as 2-D array operations on that timeline's rows
+    values = panel.to_numpy()
+    observed, groups = timeline_groups(values)
+    batched = groups[index_a] == groups[index_b]
+    batch_stats = {}
+    for group in np.unique(groups[index_a[batched]]):
+        positions = np.flatnonzero(batched & (groups[index_a] == group))
+        group_values = values[observed[:, index_a[positions[0]]]]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            finite = np.isfinite(np.log(group_values[:, index_a[positions]] / group_values[:, index_b[positions]])).all(axis=0)
+        positions = positions[finite]
+        _, passing, last_z_scores, half_lives, mean_reversion_ratios = batch_reversion_stats(group_values, index_a[positions], index_b[positions])
+        for k, position in enumerate(positions):
+            batch_stats[position] = (passing[k], last_z_scores[k], half_lives[k], mean_reversion_ratios[k])
+
+    results = []
+    for position, pair in enumerate(tqdm(passing_pairs, desc="Calculating Z-Scores and Half-Lives")):
+        if position in batch_stats:
+            passed, z_score, half_life, mean_reversion_ratio = batch_stats[position]
+            if not passed:
+                continue
+        else:
+            analysis = _analyze_pair(pair, panel)
+            if analysis is None:
+                continue
+            z_score, half_life, mean_reversion_ratio = analysis
 
         results.append({
             "Ax": pair["Ax"],
             "Bx": pair["Bx"],
             "p_value": pair["p_value"],
-            "Z_score": round(z_scores.iloc[-1], 2),
+            "Z_score": z_score,
             "half_life": half_life,
             "mean_reversion_ratio": mean_reversion_ratio,
-            "has_dominant_frequency": has_dominant_frequency
+            "has_dominant_frequency": 1
         })
 
-        pair_name = f"{pair['Ax']}_{pair['Bx']}"
-        chart_zscore(pair_name, z_scores)
-
+    record_items(pairs_analysed=len(passing_pairs), pairs_passed=len(results))
     return results
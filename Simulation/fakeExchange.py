@@ -0,0 +1,132 @@
+import json
+import time
+import random
+import threading
+from collections import Counter
+import ccxt
+
+# Minimum order size reported for every simulated market
+MIN_ORDER_AMOUNT = 0.001
+
+# Simulated round-trip time for each REST call, and the share of order calls that fail with a network error
+ORDER_LATENCY_SECONDS = 0.05
+ORDER_FAILURE_RATE = 0.1
+
+class FakeExchange:
+    """Local stand-in for the ccxt Bitget client that fills market orders after a delay and records every order."""
+
+    def __init__(self, latency=ORDER_LATENCY_SECONDS, failure_rate=ORDER_FAILURE_RATE, seed=0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.orders = []
+        self.leverage = {}
+        self.calls = Counter()  # REST calls made, by method name
+        self.options = {}
+        self.lock = threading.Lock()
+
+    def _request(self, method):
+        with self.lock:
+            self.calls[method] += 1
+        time.sleep(self.latency)
+
+    def _price(self, symbol):
+        # Stable made-up price per symbol
+        return round(random.Random(symbol).uniform(0.1, 100), 4)
+
+    def _fill(self, symbol, side, amount):
+        self._request('create_order')
+        with self.lock:
+            if self.random.random() < self.failure_rate:
+                raise ccxt.NetworkError(f"simulated network error placing {side} order on {symbol}")
+            order = {'id': str(len(self.orders) + 1), 'symbol': symbol, 'side': side, 'amount': amount}
+            self.orders.append(order)
+        return order
+
+    def create_market_sell_order(self, symbol, amount, params=None):
+        return self._fill(symbol, 'sell', amount)
+
+    def create_market_buy_order(self, symbol, amount, params=None):
+        return self._fill(symbol, 'buy', amount)
+
+    def create_order(self, symbol, type, side, amount, price=None, params=None):
+        return self._fill(symbol, side, amount)
+
+    def fetch_ticker(self, symbol):
+        self._request('fetch_ticker')
+        return {'symbol': symbol, 'last': self._price(symbol)}
+
+    def fetch_tickers(self, symbols=None):
+        self._request('fetch_tickers')
+        return {symbol: {'symbol': symbol, 'last': self._price(symbol)} for symbol in symbols or []}
+
+    def set_leverage(self, leverage, symbol, params=None):
+        self._request('set_leverage')
+        with self.lock:
+            self.leverage[symbol] = leverage
+
+    def load_markets(self):
+        self._request('load_markets')
+
+    def market(self, symbol):
+        return {'symbol': symbol, 'limits': {'amount': {'min': MIN_ORDER_AMOUNT}}, 'precision': {'amount': MIN_ORDER_AMOUNT}}
+
+    def fetch_balance(self):
+        self._request('fetch_balance')
+        return {'info': [{'marginCoin': 'USDT', 'available': '1000'}]}
+
+class FakeWebSocket:
+    """Local stand-in for websocket.WebSocketApp that replays random-walk candle1m updates for the subscribed tickers."""
+
+    def __init__(self, url, on_open=None, on_message=None, on_error=None, on_close=None, ticks=10000, prices=None, volatility=0.002, seed=0):
+        self.url = url
+        self.on_open = on_open
+        self.on_message = on_message
+        self.ticks = ticks
+        self.prices = dict(prices or {})
+        self.volatility = volatility
+        self.random = random.Random(seed)
+        self.symbols = []
+
+    def send(self, message):
+        """Record the tickers named in a subscribe message."""
+        message = json.loads(message)
+        if message.get('op') == 'subscribe':
+            self.symbols.extend(arg['instId'] for arg in message['args'])
+
+    def run_forever(self, **kwargs):
+        """Open, then push one candle update per tick for a random subscribed ticker and return once all are sent."""
+        if self.on_open:
+            self.on_open(self)
+        self.symbols = sorted(set(self.symbols))
+        for symbol in self.symbols:
+            self.prices.setdefault(symbol, 1.0)
+
+        timestamp = int(time.time() * 1000)
+        for tick in range(self.ticks):
+            symbol = self.random.choice(self.symbols)
+            self.prices[symbol] *= 1 + self.random.gauss(0, self.volatility)
+            price = str(self.prices[symbol])
+            candle = [str(timestamp + tick * 1000), price, price, price, price, "0"]
+            self.on_message(self, json.dumps({'action': 'update', 'arg': {'instType': 'mc', 'channel': 'candle1m', 'instId': symbol}, 'data': [candle]}))
+
+    def close(self):
+        pass
+
+def simulated_trades(n_trades, seed=0):
+    """Synthetic monitored trades over made-up tickers, with mean reversion ratios close to the starting price ratio."""
+    generator = random.Random(seed)
+    symbols = [f"SIM{k:03d}USDT" for k in range(max(2, n_trades))]
+    trades = []
+    for k in range(n_trades):
+        base, quote = generator.sample(symbols, 2)
+        side = generator.choice(['long', 'short'])
+        trades.append({
+            'pair': f"{base}/{quote}",
+            'side': side,
+            'trade_id': str(k + 1),
+            'amount': 1.0,
+            # All tickers start at 1.0, so each trade closes once the ratio drifts about 1% the right way
+            'mean_reversion_ratio': 1.01 if side == 'long' else 0.99,
+        })
+    return trades
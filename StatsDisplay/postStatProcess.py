@@ -1,9 +1,11 @@
 import os
 import csv
-import pandas as pd
 from datetime import datetime
-from Cointegration.cointegration import run_cointegration_analysis
-from Reversion.zScore import run_zscore_analysis
+from Cointegration.cointegration import run_cointegration_analysis, rolling_cointegration, save_cointegrated_pairs
+from Reversion.zScore import run_zscore_analysis, render_signal_charts
+from DataUtils.pricePanel import load_price_panel, MIN_ROWS
+from DataUtils.candleStore import get_candle_store, CLOSE_COLUMN
+from Instrumentation.stageMetrics import stage, record_items
 from dotenv import load_dotenv
 from termcolor import colored
 
@@ -36,23 +38,23 @@ COLORS = {
 }
 
 TRADES_DIR = 'StatsDisplay/Trades'
-TICKERS_DIR = 'Binance/Tickers'
+ROLLING_DIR = 'StatsDisplay/Rolling'
 os.makedirs(TRADES_DIR, exist_ok=True)
 
-def get_latest_price_from_csv(ticker):
-    """Fetch the latest close price from the CSV file for a given ticker."""
-    file_path = os.path.join(TICKERS_DIR, f"{ticker}.csv")
+def get_latest_price(ticker):
+    """Fetch the latest stored close price for a given ticker."""
+    store = get_candle_store()
 
-    if not os.path.isfile(file_path):
+    if not store.exists(ticker):
         print(f"Warning: File for {ticker} not found.")
         return None
 
-    # Read the last row from the CSV file
-    df = pd.read_csv(file_path)
-    if 'Close' in df.columns and not df.empty:
-        return df['Close'].iloc[-1]
+    # Read the last stored candle
+    candles = store.read(ticker)
+    if candles is not None and len(candles):
+        return float(candles[-1, CLOSE_COLUMN])
     else:
-        print(f"Warning: 'Close' column missing or data empty in {ticker}.csv")
+        print(f"Warning: 'Close' column missing or data empty in {store.path(ticker)}")
         return None
 
 def find_basket(pair):
@@ -62,49 +64,8 @@ def find_basket(pair):
             return basket_name
     return None
 
-def process_and_display_stats():
-    """Run cointegration and z-score analyses, then display filtered results and save trades to CSV."""
-    # Step 1: Run cointegration analysis and get pairs with p < 0.05
-    print("Running cointegration analysis...")
-    passing_pairs = run_cointegration_analysis()
-
-    # Step 2: Run z-score and half-life analysis on pairs passing cointegration
-    print("\nRunning z-score analysis and related z-score metrics...")
-    zscore_results = [result for result in run_zscore_analysis(passing_pairs) if result is not None]
-
-    # Step 3: Prepare data for CSV output
-    timestamp = datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
-    csv_file_path = os.path.join(TRADES_DIR, f"{timestamp}.csv")
-    trades = []
-
-    # Step 4: Collect initial trade entries
-    for result in zscore_results:
-        asset_a = result['Ax']
-        asset_b = result['Bx']
-        side = "long" if result["Z_score"] < 0 else "short"
-        half_life = result['half_life']
-
-        # Fetch prices and calculate trade price ratio
-        current_price_a = get_latest_price_from_csv(asset_a)
-        current_price_b = get_latest_price_from_csv(asset_b)
-        if current_price_a is not None and current_price_b is not None:
-            current_price_ratio = round(current_price_a / current_price_b, 5)
-        else:
-            print(f"Warning: Skipping pair {asset_a}/{asset_b} due to missing data.")
-            continue
-
-        # Add trade entry to list
-        trades.append({
-            "PAIR": f"{asset_a}/{asset_b}",
-            "ASSET_A": asset_a,
-            "ASSET_B": asset_b,
-            "SIDE": side,
-            "HALF_LIFE": half_life,
-            "MEAN_REVERSION_RATIO": result['mean_reversion_ratio'],
-            "TRADE_PRICE_RATIO": current_price_ratio
-        })
-
-    # Step 5: Resolve conflicting positions for each asset
+def resolve_asset_conflicts(trades):
+    """Keep only trades whose assets are on the same side as in the earlier trades that use them."""
     asset_sides = {}  # Track the chosen side and lowest total half-life for each asset
     filtered_trades = []
 
@@ -130,23 +91,99 @@ def process_and_display_stats():
         # If side matches for asset, add to the filtered list
         filtered_trades.append(trade)
 
-    # Step 6: Display and save filtered trades
-    output_trades = []
-    for trade in filtered_trades:
-        output_trades.append({
-            "PAIR": trade["PAIR"],
-            "SIDE": trade["SIDE"],
-            "HALF_LIFE": trade["HALF_LIFE"],
-            "MEAN_REVERSION_RATIO": trade["MEAN_REVERSION_RATIO"],
-            "TRADE_PRICE_RATIO": trade["TRADE_PRICE_RATIO"]
-        })
-
-        print(f"{trade['PAIR']} - {trade['SIDE'].upper()} - Half-life: {trade['HALF_LIFE']}, Mean Reversion Ratio: {trade['MEAN_REVERSION_RATIO']}, Trade Price Ratio: {trade['TRADE_PRICE_RATIO']}")
-
-    # Step 7: Save final trade signals to CSV
-    with open(csv_file_path, mode='w', newline='') as csv_file:
-        writer = csv.DictWriter(csv_file, fieldnames=["PAIR", "SIDE", "HALF_LIFE", "MEAN_REVERSION_RATIO", "TRADE_PRICE_RATIO"])
-        writer.writeheader()
-        writer.writerows(output_trades)
-
-    print(f"\nTrade signals saved to {csv_file_path}")
+    return filtered_trades
+
+def process_and_display_stats(workers=1, prescreen='off', prescreen_threshold=None, pair_cache=False, charts=True, chart_top_k=None,
+                              rolling_window=None, min_rows=MIN_ROWS, panel=None, passing_pairs=None):
+    """Run cointegration and z-score analyses, then display filtered results and save trades to CSV.
+
+    A panel and passing pairs already produced by the streaming scan skip the loading and cointegration steps.
+    """
+    # Step 1: Load every ticker once into a shared price panel, then run cointegration analysis and get pairs with p < 0.05
+    if panel is None:
+        with stage('price_panel'):
+            panel = load_price_panel(min_rows=min_rows)
+            record_items(tickers_loaded=panel.shape[1], candles_loaded=panel.shape[0])
+    if passing_pairs is None:
+        print("Running cointegration analysis...")
+        with stage('cointegration'):
+            passing_pairs = run_cointegration_analysis(panel, workers=workers, prescreen=prescreen, prescreen_threshold=prescreen_threshold,
+                                                       baskets=BASKETS, pair_cache=pair_cache)
+    save_cointegrated_pairs(passing_pairs)
+
+    timestamp = datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
+
+    # Optionally track how each passing pair's p-value evolved over rolling windows
+    if rolling_window and passing_pairs:
+        with stage('rolling'):
+            os.makedirs(ROLLING_DIR, exist_ok=True)
+            rolling_path = os.path.join(ROLLING_DIR, f"{timestamp}.csv")
+            rolling_cointegration(panel, passing_pairs, window=rolling_window).to_csv(rolling_path)
+            print(f"Rolling cointegration p-values saved to {rolling_path}")
+
+    # Step 2: Run z-score and half-life analysis on pairs passing cointegration
+    print("\nRunning z-score analysis and related z-score metrics...")
+    with stage('zscore'):
+        zscore_results = [result for result in run_zscore_analysis(passing_pairs, panel) if result is not None]
+
+    with stage('signals'):
+        # Step 3: Prepare data for CSV output
+        csv_file_path = os.path.join(TRADES_DIR, f"{timestamp}.csv")
+        trades = []
+
+        # Step 4: Collect initial trade entries
+        for result in zscore_results:
+            asset_a = result['Ax']
+            asset_b = result['Bx']
+            side = "long" if result["Z_score"] < 0 else "short"
+            half_life = result['half_life']
+
+            # Fetch prices and calculate trade price ratio
+            current_price_a = get_latest_price(asset_a)
+            current_price_b = get_latest_price(asset_b)
+            if current_price_a is not None and current_price_b is not None:
+                current_price_ratio = round(current_price_a / current_price_b, 5)
+            else:
+                print(f"Warning: Skipping pair {asset_a}/{asset_b} due to missing data.")
+                continue
+
+            # Add trade entry to list
+            trades.append({
+                "PAIR": f"{asset_a}/{asset_b}",
+                "ASSET_A": asset_a,
+                "ASSET_B": asset_b,
+                "SIDE": side,
+                "HALF_LIFE": half_life,
+                "MEAN_REVERSION_RATIO": result['mean_reversion_ratio'],
+                "TRADE_PRICE_RATIO": current_price_ratio
+            })
+
+        # Step 5: Resolve conflicting positions for each asset
+        filtered_trades = resolve_asset_conflicts(trades)
+
+        # Step 6: Display and save filtered trades
+        output_trades = []
+        for trade in filtered_trades:
+            output_trades.append({
+                "PAIR": trade["PAIR"],
+                "SIDE": trade["SIDE"],
+                "HALF_LIFE": trade["HALF_LIFE"],
+                "MEAN_REVERSION_RATIO": trade["MEAN_REVERSION_RATIO"],
+                "TRADE_PRICE_RATIO": trade["TRADE_PRICE_RATIO"]
+            })
+
+            print(f"{trade['PAIR']} - {trade['SIDE'].upper()} - Half-life: {trade['HALF_LIFE']}, Mean Reversion Ratio: {trade['MEAN_REVERSION_RATIO']}, Trade Price Ratio: {trade['TRADE_PRICE_RATIO']}")
+
+        # Step 7: Save final trade signals to CSV
+        with open(csv_file_path, mode='w', newline='') as csv_file:
+            writer = csv.DictWriter(csv_file, fieldnames=["PAIR", "SIDE", "HALF_LIFE", "MEAN_REVERSION_RATIO", "TRADE_PRICE_RATIO"])
+            writer.writeheader()
+            writer.writerows(output_trades)
+
+        print(f"\nTrade signals saved to {csv_file_path}")
+        record_items(signals_written=len(output_trades))
+
+    # Step 8: Render Z-score charts once the signals are on disk
+    if charts:
+        with stage('charts'):
+            render_signal_charts(zscore_results, panel, workers=workers, top_k=chart_top_k)
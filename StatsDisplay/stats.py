@@ -13,30 +13,99 @@ import ccxt
 import numpy as np
 import os
 import csv
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 from tabulate import tabulate
 from tqdm import tqdm  # Import tqdm for progress bar
 from datetime import datetime
-from DataUtils.candleUtils import fetch_all_candle_data, fetch_candle_data  # Correct import
+from DataUtils.candleUtils import fetch_all_candle_data
 
 # Constants
 TRADES_DIR = 'StatsDisplay/Trades'
 CHARTS_DIR = 'StatsDisplay/Charts'  # Directory to save charts
 load_dotenv()
 
+# Candle interval for the cumulative profit chart
+PROFIT_TIMEFRAME = '5m'
+PROFIT_INTERVAL_MS = 5 * 60 * 1000
+
+# Latest prices shared by report runs made within PRICE_CACHE_TTL_SECONDS of each other
+PRICE_CACHE_FILE = 'StatsDisplay/price_cache.json'
+PRICE_CACHE_TTL_SECONDS = 60
+
+# Concurrent per-symbol requests when the bulk ticker call fails
+PRICE_FETCH_WORKERS = 16
+
 # Initialize Binance client
 exchange = ccxt.binance()
 
-def get_prices(symbols):
-    """Fetch the current prices of given symbols in batch."""
+def to_market_symbol(ticker):
+    """Reformat a TICKERUSDT symbol as 'TICKER/USDT'."""
+    return f"{ticker.replace('USDT', '')}/USDT"
+
+def load_price_cache(path=PRICE_CACHE_FILE):
+    """Load recently fetched prices, or an empty cache."""
+    if not os.path.isfile(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+def save_price_cache(cache, path=PRICE_CACHE_FILE):
+    """Persist fetched prices for report runs made shortly after this one."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, mode='w') as file:
+        json.dump(cache, file)
+
+def fetch_price(symbol):
+    """Fetch the current price of one symbol, or None."""
+    try:
+        ticker = exchange.fetch_ticker(to_market_symbol(symbol))
+        return ticker['last'] if 'last' in ticker else None
+    except Exception as e:
+        print(f"Error fetching price for {symbol}: {e}")
+        return None
+
+def fetch_prices(symbols):
+    """Fetch the current prices of the given symbols with one bulk ticker call, falling back to concurrent per-symbol calls."""
     prices = {}
-    for symbol in tqdm(symbols, desc="Fetching historical data since trade", unit="symbol"):
+    try:
+        tickers = exchange.fetch_tickers([to_market_symbol(symbol) for symbol in symbols])
+        for symbol in symbols:
+            ticker = tickers.get(to_market_symbol(symbol))
+            if ticker is not None and ticker.get('last') is not None:
+                prices[symbol] = ticker['last']
+    except Exception as e:
+        print(f"Bulk ticker fetch failed, falling back to per-symbol requests: {e}")
+
+    missing = [symbol for symbol in symbols if symbol not in prices]
+    if missing:
         try:
-            ticker = exchange.fetch_ticker(symbol)
-            prices[symbol] = ticker['last'] if 'last' in ticker else None
+            exchange.load_markets()  # Load once here rather than in every concurrent request
         except Exception as e:
-            print(f"Error fetching price for {symbol}: {e}")
-            prices[symbol] = None
+            print(f"Error loading markets: {e}")
+            return {**prices, **{symbol: None for symbol in missing}}
+        with ThreadPoolExecutor(max_workers=PRICE_FETCH_WORKERS) as pool:
+            futures = {pool.submit(fetch_price, symbol): symbol for symbol in missing}
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Fetching prices", unit="symbol"):
+                prices[futures[future]] = future.result()
+    return prices
+
+def get_prices(symbols):
+    """Fetch the current prices of given symbols in batch, reusing prices fetched in the last PRICE_CACHE_TTL_SECONDS."""
+    cache = load_price_cache()
+    now = time.time()
+    prices = {symbol: cache[symbol]['price'] for symbol in symbols
+              if symbol in cache and now - cache[symbol]['cached_at'] < PRICE_CACHE_TTL_SECONDS}
+
+    stale = sorted(symbol for symbol in symbols if symbol not in prices)
+    if stale:
+        fetched = fetch_prices(stale)
+        prices.update(fetched)
+        cache.update({symbol: {'price': price, 'cached_at': now} for symbol, price in fetched.items() if price is not None})
+        save_price_cache(cache)
+    print(f"Prices: fetched {len(stale)} of {len(symbols)} symbols, reused {len(symbols) - len(stale)} cached.")
     return prices
 
 def calculate_trade_performance(pair, side, half_life, mean_reversion_ratio, trade_price_ratio, prices):
@@ -158,76 +227,73 @@ def analyze_trade_results(filename):
     print(f"\nGenerating performance chart...\n")
 
     # Generate performance chart
-    # generate_profit_chart(trades, timestamp_str)
+    generate_profit_chart(trades, timestamp_str)
 
     # Store results for later printing
     return sorted_results, total_profit
 
-def generate_profit_chart(trades, timestamp_str):
-    """Generate a profit chart that shows net % profit across all trades."""
-    # Parse the timestamp from the filename
-    trade_time = datetime.strptime(timestamp_str, "%Y-%m-%d-%H-%M-%S")
-    start_time = int(trade_time.timestamp() * 1000)  # Convert to milliseconds
-
-    # Prepare a list to hold DataFrames for each trade
-    profit_dfs = []
+def fetch_close_matrix(assets, start_time, timeframe=PROFIT_TIMEFRAME):
+    """Fetch candles since start_time once per asset and align their closes on a common grid, forward-filling gaps."""
+    assets = sorted(assets)
+    candles = fetch_all_candle_data(assets, timeframe, None, since=start_time)
 
-    # Extract unique pairs and process trades
-    for trade in trades:
-        pair = trade['PAIR'].strip()  # Remove any extra spaces
-        side = trade['SIDE'].strip()   # Remove any extra spaces
-        asset_a, asset_b = pair.split('/')
-
-        # Debugging output
-        print(f"Fetching historical data for: {asset_a}, {asset_b}, Side: {side}")
-
-        # Fetch historical candle data for both assets from the start time
-        historical_a = fetch_candle_data(asset_a, '5m', limit=None, since=start_time)
-        historical_b = fetch_candle_data(asset_b, '5m', limit=None, since=start_time)
-
-        # Check if data was fetched correctly
-        if historical_a is None or historical_b is None:
-            print(f"Warning: No historical data for {asset_a} or {asset_b}. Skipping...")
+    closes = {}
+    for asset, ohlcv in zip(assets, candles):
+        if not ohlcv:
+            print(f"Warning: No historical data for {asset}.")
             continue
+        ohlcv = np.asarray(ohlcv, dtype=np.float64)
+        closes[asset] = pd.Series(ohlcv[:, 4], index=ohlcv[:, 0].astype('int64'))
+    if not closes:
+        return pd.DataFrame()
 
-        # Convert to DataFrames
-        df_a = pd.DataFrame(historical_a, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-        df_b = pd.DataFrame(historical_b, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
+    closes = pd.DataFrame(closes).sort_index()
+    grid = np.arange(closes.index[0], closes.index[-1] + 1, PROFIT_INTERVAL_MS)
+    return closes.reindex(closes.index.union(grid)).ffill().reindex(grid)
 
-        # Convert timestamps to datetime
-        df_a['timestamp'] = pd.to_datetime(df_a['timestamp'], unit='ms')
-        df_b['timestamp'] = pd.to_datetime(df_b['timestamp'], unit='ms')
+def pair_profit_matrix(trades, closes):
+    """Percentage change of every trade's price ratio since entry, one column per pair on the close matrix grid."""
+    trades = [trade for trade in trades if all(asset in closes.columns for asset in trade['PAIR'].strip().split('/'))]
+    if not trades:
+        return pd.DataFrame(index=closes.index)
 
-        # Merge the two DataFrames on timestamp
-        merged_df = pd.merge_asof(df_a.sort_values('timestamp'), df_b.sort_values('timestamp'), on='timestamp', suffixes=('_a', '_b'))
+    legs = [trade['PAIR'].strip().split('/') for trade in trades]
+    long_side = np.array([trade['SIDE'].strip().upper() == 'LONG' for trade in trades])
+    prices_a = closes[[asset_a for asset_a, _ in legs]].to_numpy()
+    prices_b = closes[[asset_b for _, asset_b in legs]].to_numpy()
 
-        # Calculate the profit ratio based on the trade side
-        if side.upper() == 'LONG':
-            merged_df['profit_ratio'] = (merged_df['close_a'] / merged_df['close_b'])
-        elif side.upper() == 'SHORT':
-            merged_df['profit_ratio'] = (merged_df['close_b'] / merged_df['close_a'])
+    # Long trades profit from a rising A/B ratio, short trades from a rising B/A ratio
+    profit_ratio = np.where(long_side, prices_a / prices_b, prices_b / prices_a)
 
-        # Calculate percentage change from the entry point
-        merged_df['percentage_change'] = (merged_df['profit_ratio'] - merged_df['profit_ratio'].iloc[0]) / merged_df['profit_ratio'].iloc[0] * 100
+    # Entry is the first bar where both legs have a price
+    valid = ~np.isnan(profit_ratio)
+    entry = profit_ratio[valid.argmax(axis=0), np.arange(profit_ratio.shape[1])]
+    percentage_change = np.nan_to_num((profit_ratio - entry) / entry * 100)
 
-        # Handle NaN values by filling them with 0 for calculations
-        merged_df['percentage_change'].fillna(0, inplace=True)
+    return pd.DataFrame(percentage_change, index=closes.index, columns=[trade['PAIR'].strip() for trade in trades])
 
-        # Add the DataFrame to the profit_dfs list
-        profit_dfs.append(merged_df[['timestamp', 'percentage_change']])
+def generate_profit_chart(trades, timestamp_str):
+    """Generate a profit chart that shows net % profit across all trades."""
+    # Parse the timestamp from the filename
+    trade_time = datetime.strptime(timestamp_str, "%Y-%m-%d-%H-%M-%S")
+    start_time = int(trade_time.timestamp() * 1000)  # Convert to milliseconds
 
-    # Combine all DataFrames into one
-    if not profit_dfs:
+    # Fetch every asset once, then compute all pairs and the portfolio total as column operations
+    assets = {asset for trade in trades for asset in trade['PAIR'].strip().split('/')}
+    closes = fetch_close_matrix(assets, start_time)
+    if closes.empty:
         print("No valid profit DataFrames to combine.")
         return
 
-    overall_profit_df = profit_dfs[0]
-    for df in profit_dfs[1:]:
-        overall_profit_df = pd.merge_asof(overall_profit_df.sort_values('timestamp'), df.sort_values('timestamp'), on='timestamp', suffixes=('', '_new'))
+    pair_profits = pair_profit_matrix(trades, closes)
+    if pair_profits.empty:
+        print("No valid profit DataFrames to combine.")
+        return
 
-        # Ensure the new percentage_change column exists
-        if 'percentage_change_new' in overall_profit_df.columns:
-            overall_profit_df['percentage_change'] += overall_profit_df['percentage_change_new'].fillna(0)
+    overall_profit_df = pd.DataFrame({
+        'timestamp': pd.to_datetime(pair_profits.index, unit='ms'),
+        'percentage_change': pair_profits.sum(axis=1).to_numpy(),
+    })
 
     # Plotting the overall cumulative profit as percentage
     plt.style.use('dark_background')
@@ -1,9 +1,12 @@
 import os
 import argparse
 import csv
+import json
 import ccxt
 from dotenv import load_dotenv
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from DataUtils.tickerUtils import get_bitget_usdt_symbols  # Import from tickerUtils
 
 # Load API keys from .env file
@@ -22,6 +25,37 @@ exchange = ccxt.bitget({
 })
 
 ACTIVE_TRADES_FILE = 'active_trades.csv'
+SIMULATED_TRADES_FILE = 'Simulation/active_trades.csv'
+DEFAULT_LEVERAGE = 10
+
+# Pairs executed at once; each pair submits its two legs concurrently on top of this
+MAX_CONCURRENCY = 8
+
+# Pair executions append to the active trades file from several threads
+save_lock = threading.Lock()
+
+# Market limits and the leverage already applied per symbol, kept across runs
+MARKET_CACHE_FILE = 'market_cache.json'
+SIMULATED_MARKET_CACHE_FILE = 'Simulation/market_cache.json'
+MARKET_CACHE_TTL_HOURS = 24
+LEVERAGE_CACHE_TTL_HOURS = 6
+
+def load_market_cache(path=MARKET_CACHE_FILE):
+    """Load cached market limits and applied leverage, or an empty cache."""
+    if not os.path.isfile(path):
+        return {'markets': {}, 'leverage': {}}
+    with open(path) as file:
+        return json.load(file)
+
+def save_market_cache(cache, path=MARKET_CACHE_FILE):
+    """Persist market limits and applied leverage for the next run."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, mode='w') as file:
+        json.dump(cache, file)
+
+def is_fresh(entry, ttl_hours):
+    """Whether a cache entry was written within the last ttl_hours."""
+    return entry is not None and time.time() - entry['cached_at'] < ttl_hours * 3600
 
 def clear_active_trades_file():
     """Initialize or clear the active trades file."""
@@ -32,13 +66,103 @@ def clear_active_trades_file():
 
 def save_trade_id(pair, side, trade_id, amount):
     """Save trade details to the active trades CSV file."""
-    with open(ACTIVE_TRADES_FILE, mode='a', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow([pair, side, trade_id, amount])
+    with save_lock:
+        with open(ACTIVE_TRADES_FILE, mode='a', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow([pair, side, trade_id, amount])
     print(f"Trade saved: {pair} {side} with ID {trade_id}")
 
-def execute_trade(pair, side, monetary_value_per_ticker, leverage=10, retries=3):
-    """Execute a long or short trade on each individual ticker in the pair with leveraged monetary exposure."""
+def to_swap_symbol(ticker):
+    """Reformat a TICKERUSDT symbol as 'TICKER/USDT:USDT'."""
+    return f"{ticker.replace('USDT', '')}/USDT:USDT"
+
+def fetch_last_price(symbol):
+    """Latest price for one symbol, or None if it cannot be fetched."""
+    try:
+        return exchange.fetch_ticker(symbol)['last']
+    except Exception as e:
+        print(f"Error fetching price for {symbol}: {e}")
+        return None
+
+def fetch_last_prices(symbols, max_concurrency=MAX_CONCURRENCY):
+    """Latest price for every symbol in one bulk fetch_tickers call, falling back to per-symbol calls if it fails.
+
+    One unknown or delisted symbol makes the bulk call raise, so the fallback keeps it from sinking the whole batch;
+    symbols left without a price are skipped by execute_trade.
+    """
+    try:
+        tickers = exchange.fetch_tickers(symbols)
+        return {symbol: tickers[symbol]['last'] for symbol in symbols if symbol in tickers}
+    except Exception as e:
+        print(f"Bulk ticker fetch failed, falling back to per-symbol requests: {e}")
+
+    try:
+        exchange.load_markets()  # Load once here rather than in every concurrent request
+    except Exception as e:
+        print(f"Error loading markets: {e}")
+        return {}
+    with ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+        prices = dict(zip(symbols, pool.map(fetch_last_price, symbols)))
+    return {symbol: price for symbol, price in prices.items() if price is not None}
+
+def get_market_limits(symbols, cache):
+    """Minimum order amount per symbol, looking up only markets missing or stale in the cache.
+
+    Symbols the exchange does not list are left out, so execute_trade skips their pairs instead of the batch failing.
+    """
+    stale = [symbol for symbol in symbols if not is_fresh(cache['markets'].get(symbol), MARKET_CACHE_TTL_HOURS)]
+    if stale:
+        exchange.load_markets()
+        for symbol in stale:
+            try:
+                market = exchange.market(symbol)
+            except Exception as e:
+                print(f"Error looking up market for {symbol}: {e}")
+                cache['markets'].pop(symbol, None)
+                continue
+            cache['markets'][symbol] = {
+                'min_amount': market['limits']['amount']['min'],
+                'cached_at': time.time(),
+            }
+    print(f"Market cache: looked up {len(stale)} of {len(symbols)} markets.")
+    return {symbol: cache['markets'][symbol] for symbol in symbols if symbol in cache['markets']}
+
+def set_leverage_all(symbols, cache, leverage=DEFAULT_LEVERAGE, margin_coin='USDT', max_concurrency=MAX_CONCURRENCY):
+    """Set leverage in parallel on every symbol not already known to be at this leverage; return the symbols where it failed."""
+    def set_leverage(symbol):
+        try:
+            exchange.set_leverage(leverage, symbol, params={'marginCoin': margin_coin})
+            return None
+        except Exception as e:
+            print(f"Error setting leverage for {symbol}: {e}")
+            return symbol
+
+    pending = [symbol for symbol in symbols
+               if not (is_fresh(cache['leverage'].get(symbol), LEVERAGE_CACHE_TTL_HOURS) and cache['leverage'][symbol]['leverage'] == leverage)]
+    with ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+        failed = {symbol for symbol in pool.map(set_leverage, pending) if symbol is not None}
+
+    for symbol in pending:
+        if symbol in failed:
+            cache['leverage'].pop(symbol, None)
+        else:
+            cache['leverage'][symbol] = {'leverage': leverage, 'cached_at': time.time()}
+    print(f"Leverage set to {leverage}x for {len(pending) - len(failed)} of {len(pending)} symbols; "
+          f"{len(symbols) - len(pending)} already at {leverage}x")
+    return failed
+
+def place_leg(symbol, side, amount, params, retries=3):
+    """Place one market order leg, retrying only this leg if it fails."""
+    for attempt in range(retries):
+        try:
+            return exchange.create_order(symbol, 'market', side, amount, None, params)
+        except Exception as e:
+            print(f"Error placing {side} order for {symbol} on attempt {attempt + 1}: {e}")
+            time.sleep(1)  # Wait before retrying if there's an error
+    return None
+
+def execute_trade(pair, side, monetary_value_per_ticker, prices, limits, leverage=DEFAULT_LEVERAGE, retries=3):
+    """Execute a long or short trade on both tickers in the pair at once, with leveraged monetary exposure."""
     base, quote = pair.split('/')
     margin_coin = 'USDT'  # Set the margin coin for USDT-margined futures
 
@@ -46,64 +170,50 @@ def execute_trade(pair, side, monetary_value_per_ticker, leverage=10, retries=3)
     exchange.options['createMarketBuyOrderRequiresPrice'] = False
     exchange.options['defaultType'] = 'swap'  # Reconfirm swap type for futures
 
-    # Reformat symbols with 'TICKER/USDT:USDT' format
-    base_symbol = f"{base.replace('USDT', '')}/USDT:USDT"
-    quote_symbol = f"{quote.replace('USDT', '')}/USDT:USDT"
+    base_symbol = to_swap_symbol(base)
+    quote_symbol = to_swap_symbol(quote)
 
-    # Retrieve market data to ensure minimum precision is met
-    base_market = exchange.market(base_symbol)
-    quote_market = exchange.market(quote_symbol)
-    min_base_amount = base_market['limits']['amount']['min']
-    min_quote_amount = quote_market['limits']['amount']['min']
+    # Use the cached market limits to ensure minimum precision is met
+    if base_symbol not in limits or quote_symbol not in limits:
+        print(f"Skipping {pair}: no market limits for {base_symbol if base_symbol not in limits else quote_symbol}.")
+        return
+    min_base_amount = limits[base_symbol]['min_amount']
+    min_quote_amount = limits[quote_symbol]['min_amount']
 
     # Calculate the leveraged dollar equivalent for each side of the trade
     leveraged_value = monetary_value_per_ticker * leverage  # Apply leverage
 
-    # Get the latest market prices to calculate the actual trade amounts
-    base_price = exchange.fetch_ticker(base_symbol)['last']
-    quote_price = exchange.fetch_ticker(quote_symbol)['last']
+    # Use the prices prefetched for the whole batch to calculate the actual trade amounts
+    base_price = prices.get(base_symbol)
+    quote_price = prices.get(quote_symbol)
+    if not base_price or not quote_price:
+        print(f"Skipping {pair}: no price for {base_symbol if not base_price else quote_symbol}.")
+        return
 
     # Ensure both sides meet the minimum constraints for trading volume
     base_amount = max(leveraged_value / base_price, min_base_amount)
     quote_amount = max(leveraged_value / quote_price, min_quote_amount)
 
-    # Set leverage for each ticker
-    try:
-        exchange.set_leverage(leverage, base_symbol, params={'marginCoin': margin_coin})
-        exchange.set_leverage(leverage, quote_symbol, params={'marginCoin': margin_coin})
-        print(f"Leverage set to {leverage}x for {base_symbol} and {quote_symbol}")
-    except Exception as e:
-        print(f"Error setting leverage for {base_symbol} and {quote_symbol}: {e}")
-        return
-
-    # Place individual trades on `base` and `quote`
-    order_type = 'market'
     base_params = {'type': 'swap', 'marginCoin': margin_coin, 'hedged': False, "oneWayMode": True, "marginMode": "isolated"}
     quote_params = {'type': 'swap', 'marginCoin': margin_coin, 'hedged': False, "oneWayMode": True, "marginMode": "isolated"}
+    base_side, quote_side = ('buy', 'sell') if side == 'long' else ('sell', 'buy')
 
-    for attempt in range(retries):
-        try:
-            if side == 'long':
-                order_base = exchange.create_order(base_symbol, order_type, 'buy', base_amount, None, base_params)
-                order_quote = exchange.create_order(quote_symbol, order_type, 'sell', quote_amount, None, quote_params)
-            else:
-                order_base = exchange.create_order(base_symbol, order_type, 'sell', base_amount, None, base_params)
-                order_quote = exchange.create_order(quote_symbol, order_type, 'buy', quote_amount, None, quote_params)
-
-            trade_id_base = order_base['id']
-            trade_id_quote = order_quote['id']
-            save_trade_id(base, side, trade_id_base, base_amount)
-            save_trade_id(quote, side, trade_id_quote, quote_amount)
-            print(f"Executed {side} trade for {base_symbol} with trade ID: {trade_id_base}")
-            print(f"Executed {side} trade for {quote_symbol} with trade ID: {trade_id_quote}")
-            break
+    # Submit both legs at the same time so they fill as close together as possible
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        base_order = pool.submit(place_leg, base_symbol, base_side, base_amount, base_params, retries)
+        quote_order = pool.submit(place_leg, quote_symbol, quote_side, quote_amount, quote_params, retries)
+        order_base, order_quote = base_order.result(), quote_order.result()
 
-        except Exception as e:
-            print(f"Error executing {side} trade for {base_symbol} and {quote_symbol} on attempt {attempt + 1}: {e}")
-            time.sleep(1)  # Wait before retrying if there's an error
+    if order_base:
+        save_trade_id(base, side, order_base['id'], base_amount)
+        print(f"Executed {side} trade for {base_symbol} with trade ID: {order_base['id']}")
+    if order_quote:
+        save_trade_id(quote, side, order_quote['id'], quote_amount)
+        print(f"Executed {side} trade for {quote_symbol} with trade ID: {order_quote['id']}")
 
-    if not trade_id_base or not trade_id_quote:
-        print(f"Failed to execute trade for {pair} after {retries} attempts.")
+    if not order_base or not order_quote:
+        print(f"Failed to execute trade for {pair} after {retries} attempts; "
+              f"{'one leg is open unhedged' if order_base or order_quote else 'no legs were opened'}.")
 
 def calculate_trade_amount(balance, risk_pct, num_tickers):
     """Calculate the monetary value allocated per ticker based on risk percentage."""
@@ -136,11 +246,20 @@ def parse_trades_file(trades_file):
     return trades
 
 def main():
+    global exchange, ACTIVE_TRADES_FILE, MARKET_CACHE_FILE
     parser = argparse.ArgumentParser(description="Execute trades from a CSV file on Bitget.")
     parser.add_argument('--trades', required=True, help="Path to the CSV file with trades")
     parser.add_argument('--risk-pct', type=float, required=True, help="Percentage of account balance to allocate")
+    parser.add_argument('--max-concurrency', type=int, default=MAX_CONCURRENCY, help="Maximum number of pairs executed at once")
+    parser.add_argument('--simulate', action='store_true', help="Execute against a local fake exchange instead of Bitget")
     args = parser.parse_args()
 
+    if args.simulate:
+        from Simulation.fakeExchange import FakeExchange
+        exchange = FakeExchange()
+        ACTIVE_TRADES_FILE = SIMULATED_TRADES_FILE
+        MARKET_CACHE_FILE = SIMULATED_MARKET_CACHE_FILE
+
     # Fetch account balance and calculate trade amount per ticker
     account_balance = get_account_balance()
     trades = parse_trades_file(args.trades)
@@ -150,12 +269,31 @@ def main():
     # Initialize or clear the active trades file
     clear_active_trades_file()
 
-    # Execute each trade in the CSV file
-    for pair, side in trades:
-        try:
-            execute_trade(pair, side, monetary_value_per_ticker)
-        except Exception as e:
-            print(f"Error executing trade for {pair}: {str(e)}")
+    # Prefetch every price in one request and set leverage on all symbols in parallel before any order goes out
+    started = time.perf_counter()
+    symbols = sorted({to_swap_symbol(ticker) for pair, _ in trades for ticker in pair.split('/')})
+    prices = fetch_last_prices(symbols, max_concurrency=args.max_concurrency)
+    cache = load_market_cache(MARKET_CACHE_FILE)
+    limits = get_market_limits(symbols, cache)
+    failed_leverage = set_leverage_all(symbols, cache, max_concurrency=args.max_concurrency)
+    save_market_cache(cache, MARKET_CACHE_FILE)
+
+    # Execute the pairs concurrently, a bounded number at a time
+    with ThreadPoolExecutor(max_workers=args.max_concurrency) as pool:
+        executions = {}
+        for pair, side in trades:
+            if any(to_swap_symbol(ticker) in failed_leverage for ticker in pair.split('/')):
+                print(f"Skipping {pair}: leverage could not be set.")
+                continue
+            executions[pair] = pool.submit(execute_trade, pair, side, monetary_value_per_ticker, prices, limits)
+
+        for pair, execution in executions.items():
+            try:
+                execution.result()
+            except Exception as e:
+                print(f"Error executing trade for {pair}: {str(e)}")
+
+    print(f"Executed {len(executions)} pairs in {time.perf_counter() - started:.2f}s")
 
 if __name__ == "__main__":
     main()
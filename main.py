@@ -1,35 +1,61 @@
 import time
 import schedule
 import argparse
-import os
 from DataUtils.tickerUtils import get_usdt_symbols
-from DataUtils.candleUtils import save_symbols_to_csv, fetch_all_candle_data, clear_existing_csv_files
+from DataUtils.candleUtils import save_symbols_to_csv, fetch_all_candle_data, clear_stored_candles, prune_stale_candles
+from DataUtils.asyncCandleUtils import fetch_all_candle_data_async
+from DataUtils.candleStore import get_candle_store
 from StatsDisplay.postStatProcess import process_and_display_stats
 from Reversion.zScore import clear_charts_directory
+from Cointegration.preScreen import PRESCREEN_METHODS
+from Cointegration.streamingScan import stream_fetch_and_scan
+from Instrumentation.stageMetrics import start_run, finish_run, stage, PIPELINE_STAGES
 
-TICKERS_DATA_DIR = 'Binance/Tickers'
+def fetch_and_process_data(reuse=False, limit=None, workers=1, prescreen='off', prescreen_threshold=None, incremental=False, async_fetch=False, pair_cache=False,
+                           charts=True, chart_top_k=None, rolling_window=None, profile=None, stream=False):
+    start_run(profile_stage=profile)
+    fetch = fetch_all_candle_data_async if async_fetch else fetch_all_candle_data
 
-def fetch_and_process_data(reuse=False, limit=None):
-    symbols = get_usdt_symbols()
+    with stage('symbols'):
+        symbols = get_usdt_symbols()
+        if limit is not None:
+            symbols = symbols[:limit]
+        save_symbols_to_csv(symbols)
 
-    if limit is not None:
-        symbols = symbols[:limit]
+    panel = passing_pairs = None
+    if not reuse and stream:
+        with stage('stream'):
+            # Scan pairs as their candles arrive instead of waiting for the whole fetch
+            if incremental:
+                prune_stale_candles(symbols)
+            else:
+                clear_stored_candles()
+            panel, passing_pairs = stream_fetch_and_scan(symbols, fetch, '1h', 1000, incremental=incremental, workers=workers)
+    elif not reuse and incremental:
+        with stage('fetch'):
+            # Keep stored candles and only append the bars that closed since the last run
+            prune_stale_candles(symbols)
+            fetch(symbols, '1h', 1000, incremental=True)
+    elif not reuse:
+        with stage('fetch'):
+            clear_stored_candles()
+            # Fetching hourly data now
+            fetch(symbols, '1h', 1000, save=True)
 
-    save_symbols_to_csv(symbols)
-
-    if not reuse:
-        clear_existing_csv_files(TICKERS_DATA_DIR)
-        # Fetching hourly data now
-        fetch_all_candle_data(symbols, '1h', 1000, save=True)
-
-    # After fetching and saving data, check for CSV files again
-    if any(f.endswith('.csv') for f in os.listdir(TICKERS_DATA_DIR)):
-        process_and_display_stats()
+    # After fetching and saving data, check for stored candles again
+    if get_candle_store().list_symbols():
+        process_and_display_stats(workers=workers, prescreen=prescreen, prescreen_threshold=prescreen_threshold, pair_cache=pair_cache,
+                                  charts=charts, chart_top_k=chart_top_k, rolling_window=rolling_window, panel=panel, passing_pairs=passing_pairs)
     else:
-        print("No CSV files found in TICKERS_DATA_DIR; skipping cointegration and z-score analysis.")
+        print("No candle files found in the candle store; skipping cointegration and z-score analysis.")
+    finish_run()
 
-def run_hourly_job(reuse=False, limit=None):
-    schedule.every().hour.at(":00").do(fetch_and_process_data, reuse=reuse, limit=limit)
+def run_hourly_job(reuse=False, limit=None, workers=1, prescreen='off', prescreen_threshold=None, incremental=False, async_fetch=False, pair_cache=False,
+                   charts=True, chart_top_k=None, rolling_window=None, profile=None, stream=False):
+    schedule.every().hour.at(":00").do(fetch_and_process_data, reuse=reuse, limit=limit, workers=workers,
+                                       prescreen=prescreen, prescreen_threshold=prescreen_threshold,
+                                       incremental=incremental, async_fetch=async_fetch, pair_cache=pair_cache,
+                                       charts=charts, chart_top_k=chart_top_k, rolling_window=rolling_window, profile=profile, stream=stream)
     while True:
         schedule.run_pending()
         time.sleep(1)
@@ -39,13 +65,34 @@ if __name__ == "__main__":
     parser.add_argument("--test", action="store_true", help="Run the fetch and process once immediately and exit.")
     parser.add_argument("--reuse", action="store_true", help="Skip data fetching but update available tickers.")
     parser.add_argument("--limit", type=int, help="Limit the number of tickers to download data for.")
+    parser.add_argument("--incremental", action="store_true", help="Append only new candles to the stored data instead of re-downloading the full window.")
+    parser.add_argument("--async-fetch", action="store_true", help="Fetch candles concurrently on one asyncio event loop under a shared rate-limit budget.")
+    parser.add_argument("--workers", type=int, default=1, help="Number of processes to spread the cointegration pair scan across.")
+    parser.add_argument("--prescreen", choices=PRESCREEN_METHODS, default='off', help="Cheap filter that prunes pairs before the full cointegration test.")
+    parser.add_argument("--prescreen-threshold", type=float, help="Minimum log-price correlation or maximum spread-variance ratio for the pre-screen.")
+    parser.add_argument("--pair-cache", action="store_true", help="Reuse cached cointegration results and only re-test pairs near the threshold or due a periodic re-test.")
+    parser.add_argument("--no-charts", action="store_true", help="Skip rendering Z-score charts for signal pairs.")
+    parser.add_argument("--chart-top-k", type=int, help="Only render Z-score charts for the K signals with the largest |Z|.")
+    parser.add_argument("--rolling-window", type=int, help="Also save rolling-window cointegration p-values over the last N bars for every passing pair.")
+    parser.add_argument("--profile", choices=PIPELINE_STAGES, help="Capture a cProfile of one pipeline stage alongside the stage metrics.")
+    parser.add_argument("--stream", action="store_true", help="Run the cointegration scan while candles are still being fetched, testing each pair once both legs are stored.")
     args = parser.parse_args()
+    if args.stream and (args.prescreen != 'off' or args.pair_cache):
+        parser.error("--stream runs the full pair scan and cannot be combined with --prescreen or --pair-cache.")
 
     clear_charts_directory()
 
     if args.test:
         # Run immediately and exit if --test flag is provided
-        fetch_and_process_data(reuse=args.reuse, limit=args.limit)
+        fetch_and_process_data(reuse=args.reuse, limit=args.limit, workers=args.workers,
+                               prescreen=args.prescreen, prescreen_threshold=args.prescreen_threshold,
+                               incremental=args.incremental, async_fetch=args.async_fetch, pair_cache=args.pair_cache,
+                               charts=not args.no_charts, chart_top_k=args.chart_top_k, rolling_window=args.rolling_window, profile=args.profile,
+                               stream=args.stream)
     else:
         # Run hourly job scheduling
-        run_hourly_job(reuse=args.reuse, limit=args.limit)
+        run_hourly_job(reuse=args.reuse, limit=args.limit, workers=args.workers,
+                       prescreen=args.prescreen, prescreen_threshold=args.prescreen_threshold,
+                       incremental=args.incremental, async_fetch=args.async_fetch, pair_cache=args.pair_cache,
+                       charts=not args.no_charts, chart_top_k=args.chart_top_k, rolling_window=args.rolling_window, profile=args.profile,
+                       stream=args.stream)
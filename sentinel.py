@@ -1,5 +1,7 @@
 import json
 import csv
+import queue
+import argparse
 import websocket
 import ccxt
 from dotenv import load_dotenv
@@ -27,9 +29,22 @@ exchange = ccxt.bitget({
 
 ACTIVE_TRADES_FILE = 'active_trades.csv'
 pairs_to_monitor = []  # Store pairs we are monitoring
+trades_by_symbol = {}  # Trades to re-evaluate when each ticker updates
 ticker_prices = {}  # Track latest close prices for tickers
 ws = None  # WebSocket connection placeholder
 
+# Message handler latency, reported every LATENCY_REPORT_INTERVAL ticks
+LATENCY_REPORT_INTERVAL = 1000
+tick_latency = {'ticks': 0, 'total_seconds': 0.0, 'max_seconds': 0.0}
+
+# Close requests are placed by worker threads, so a slow order never blocks the websocket callback
+EXECUTION_WORKERS = 4
+close_queue = queue.Queue()
+closing_trades = set()  # Trade IDs queued or closed; a trade is never submitted twice
+closing_lock = threading.Lock()
+close_results = {}  # Outcome per trade ID, 'closed' or 'failed'
+websocket_app = websocket.WebSocketApp  # Swapped for a local fake in --simulate mode
+
 def load_active_trades():
     """Load active trade details with conditions from a CSV file."""
     trades = []
@@ -45,6 +60,25 @@ def load_active_trades():
             })
     return trades
 
+def index_trades_by_symbol(trades):
+    """Parse each trade's legs once and index the trades by the tickers they contain."""
+    index = {}
+    for trade in trades:
+        trade['base'], trade['quote'] = trade['pair'].split('/')
+        for symbol in {trade['base'], trade['quote']}:
+            index.setdefault(symbol, []).append(trade)
+    return index
+
+def record_tick_latency(seconds):
+    """Accumulate the handler time for one tick and periodically print the average and worst case."""
+    tick_latency['ticks'] += 1
+    tick_latency['total_seconds'] += seconds
+    tick_latency['max_seconds'] = max(tick_latency['max_seconds'], seconds)
+    if tick_latency['ticks'] >= LATENCY_REPORT_INTERVAL:
+        average_ms = tick_latency['total_seconds'] / tick_latency['ticks'] * 1000
+        print(f"Tick handler latency over {tick_latency['ticks']} ticks: avg {average_ms:.3f} ms, max {tick_latency['max_seconds'] * 1000:.3f} ms")
+        tick_latency.update(ticks=0, total_seconds=0.0, max_seconds=0.0)
+
 def close_position(trade, base_symbol, quote_symbol, side):
     """Attempt to close a position with retry logic if an error occurs."""
     symbol = base_symbol if side == 'long' else quote_symbol  # Close the correct ticker based on the trade side
@@ -61,40 +95,69 @@ def close_position(trade, base_symbol, quote_symbol, side):
                 else:
                     order = exchange.create_market_buy_order(quote_symbol, trade['amount'])
                 print(f"Closed short position on {quote_symbol} for trade ID: {trade['trade_id']} with order: {order['id']}")
-            return
+            return True
         except Exception as e:
             print(f"Error closing {side} position on {symbol} for trade ID {trade['trade_id']}: {e}")
             time.sleep(1)
     print(f"Failed to close {side} position on {symbol} after multiple attempts.")
+    return False
+
+def enqueue_close(trade):
+    """Queue a trade for closing unless it is already queued or closed."""
+    with closing_lock:
+        if trade['trade_id'] in closing_trades:
+            return False
+        closing_trades.add(trade['trade_id'])
+    close_queue.put(trade)
+    return True
+
+def execution_worker():
+    """Take close requests off the queue, place the orders and report the outcome."""
+    while True:
+        trade = close_queue.get()
+        if trade is None:
+            close_queue.task_done()
+            return
+        closed = close_position(trade, trade['base'], trade['quote'], trade['side'])
+        with closing_lock:
+            close_results[trade['trade_id']] = 'closed' if closed else 'failed'
+            if not closed:
+                # Leave the position monitored so a later tick can queue another attempt
+                closing_trades.discard(trade['trade_id'])
+        close_queue.task_done()
+
+def start_execution_workers(workers=EXECUTION_WORKERS):
+    """Start the daemon threads that drain the close queue."""
+    for _ in range(workers):
+        threading.Thread(target=execution_worker, daemon=True).start()
 
 def on_message(ws, message):
+    started = time.perf_counter()
     message = json.loads(message)
     if 'data' in message:
+        instId = message['arg']['instId']
         for candle_data in message['data']:
-            instId = message['arg']['instId']
             close_price = float(candle_data[4])  # Extract the close price from candlestick data
             ticker_prices[instId] = close_price  # Update latest close price for this ticker
 
-            # Calculate the ratio for each pair in pairs_to_monitor
-            for trade in pairs_to_monitor:
-                base, quote = trade['pair'].split('/')
+            # Calculate the ratio only for the trades that include this ticker
+            for trade in trades_by_symbol.get(instId, ()):
+                base, quote = trade['base'], trade['quote']
                 if base in ticker_prices and quote in ticker_prices:
                     # Calculate current ratio between base and quote close prices
                     current_ratio = ticker_prices[base] / ticker_prices[quote]
                     # Check if the current ratio meets mean reversion criteria
                     if (trade['side'] == 'long' and current_ratio >= trade['mean_reversion_ratio']) or \
                        (trade['side'] == 'short' and current_ratio <= trade['mean_reversion_ratio']):
-                        close_position(trade, base, quote, trade['side'])
+                        enqueue_close(trade)
+        record_tick_latency(time.perf_counter() - started)
 
 def on_open(ws):
     """Subscribes to 1-minute candlestick data for each individual ticker."""
     print("WebSocket connection opened. Subscribing to 1-minute candlestick data.")
 
     # Gather unique tickers from the pairs to monitor
-    ticker_symbols = set()
-    for trade in pairs_to_monitor:
-        base, quote = trade['pair'].split('/')
-        ticker_symbols.update([base, quote])
+    ticker_symbols = set(trades_by_symbol)
 
     # Construct and send the subscription message
     subscribe_message = json.dumps({
@@ -116,15 +179,16 @@ def on_close(ws, close_status_code, close_msg):
 
 def start_monitoring():
     """Start monitoring with auto-reload of trades and reconnection logic."""
-    global pairs_to_monitor, ws
+    global pairs_to_monitor, trades_by_symbol, ws
     pairs_to_monitor = load_active_trades()  # Reload trades on restart
+    trades_by_symbol = index_trades_by_symbol(pairs_to_monitor)
 
     ws_url = "wss://ws.bitget.com/mix/v1/stream"  # Correct WebSocket URL for Bitget
-    ws = websocket.WebSocketApp(ws_url,
-                                on_open=on_open,
-                                on_message=on_message,
-                                on_error=on_error,
-                                on_close=on_close)
+    ws = websocket_app(ws_url,
+                       on_open=on_open,
+                       on_message=on_message,
+                       on_error=on_error,
+                       on_close=on_close)
     ws.run_forever(sslopt={"cert_reqs": ssl.CERT_NONE})
 
 def listen_for_exit():
@@ -136,7 +200,40 @@ def listen_for_exit():
         ws.close()  # Close WebSocket connection
     exit(0)
 
+def run_simulation(n_trades, ticks):
+    """Drive the monitor with a local fake exchange and websocket and check no trade is closed twice."""
+    global exchange, websocket_app, pairs_to_monitor, trades_by_symbol, ws
+    from Simulation.fakeExchange import FakeExchange, FakeWebSocket, simulated_trades
+
+    exchange = FakeExchange()
+    websocket_app = lambda url, **callbacks: FakeWebSocket(url, ticks=ticks, **callbacks)
+    pairs_to_monitor = simulated_trades(n_trades)
+    trades_by_symbol = index_trades_by_symbol(pairs_to_monitor)
+    start_execution_workers()
+
+    started = time.perf_counter()
+    ws = websocket_app("wss://simulated", on_open=on_open, on_message=on_message, on_error=on_error, on_close=on_close)
+    ws.run_forever()
+    stream_seconds = time.perf_counter() - started
+    close_queue.join()
+
+    closed = [trade_id for trade_id, outcome in close_results.items() if outcome == 'closed']
+    print(f"Simulated {ticks} ticks in {stream_seconds:.2f}s; {len(closed)} of {n_trades} trades closed "
+          f"with {len(exchange.orders)} orders ({len(exchange.orders) - len(closed)} duplicate closes).")
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Monitor active trades and close them once they revert to the mean.")
+    parser.add_argument("--simulate", action="store_true", help="Run against a local fake exchange and websocket instead of Bitget.")
+    parser.add_argument("--simulate-trades", type=int, default=50, help="Number of synthetic trades to monitor in --simulate mode.")
+    parser.add_argument("--simulate-ticks", type=int, default=20000, help="Number of synthetic candle updates to replay in --simulate mode.")
+    args = parser.parse_args()
+
+    if args.simulate:
+        run_simulation(args.simulate_trades, args.simulate_ticks)
+        exit(0)
+
+    start_execution_workers()
+
     # Start the monitoring in a separate thread
     monitoring_thread = threading.Thread(target=start_monitoring)
     monitoring_thread.start()
@@ -0,0 +1,90 @@
+import os
+import csv
+import json
+import ssl
+import time
+import argparse
+from datetime import datetime
+import websocket
+from Cointegration.cointegration import load_cointegrated_pairs
+from DataUtils.pricePanel import load_price_panel
+from Reversion.liveZScore import LiveZScore, STREAM_WINDOW
+
+WS_URL = "wss://ws.bitget.com/mix/v1/stream"
+LIVE_SIGNALS_DIR = 'StatsDisplay/LiveSignals'
+
+# Tickers per subscribe message, to keep each request well inside the exchange's frame limits
+SUBSCRIBE_BATCH_SIZE = 50
+
+stream = None  # LiveZScore engine for the current cointegrated pairs
+ws = None  # WebSocket connection placeholder
+window = STREAM_WINDOW
+
+def save_signal(signal):
+    """Append a live entry signal to today's signal file, in the trade file layout plus the signal time."""
+    os.makedirs(LIVE_SIGNALS_DIR, exist_ok=True)
+    signal_file = os.path.join(LIVE_SIGNALS_DIR, f"{datetime.now().strftime('%Y-%m-%d')}.csv")
+    new_file = not os.path.isfile(signal_file)
+    with open(signal_file, mode='a', newline='') as file:
+        writer = csv.writer(file)
+        if new_file:
+            writer.writerow(['PAIR', 'SIDE', 'Z_SCORE', 'MEAN_REVERSION_RATIO', 'TRADE_PRICE_RATIO', 'TIME'])
+        writer.writerow([f"{signal['Ax']}/{signal['Bx']}", signal['side'], signal['Z_score'],
+                         signal['mean_reversion_ratio'], signal['trade_price_ratio'], signal['time']])
+
+def on_message(ws, message):
+    message = json.loads(message)
+    if 'data' in message:
+        instId = message['arg']['instId']
+        for candle_data in message['data']:
+            # Candle rows are [timestamp, open, high, low, close, volume]
+            for signal in stream.update(instId, int(candle_data[0]), float(candle_data[4])):
+                print(f"{signal['Ax']}/{signal['Bx']} - {signal['side'].upper()} - Z-score: {signal['Z_score']}, "
+                      f"Mean Reversion Ratio: {signal['mean_reversion_ratio']}, Trade Price Ratio: {signal['trade_price_ratio']}")
+                save_signal(signal)
+
+def on_open(ws):
+    """Subscribes to 1-minute candlestick data for every ticker in the cointegrated pairs."""
+    print(f"WebSocket connection opened. Streaming Z-scores for {len(stream.pairs)} pairs across {len(stream.symbols)} tickers.")
+    for start in range(0, len(stream.symbols), SUBSCRIBE_BATCH_SIZE):
+        ws.send(json.dumps({
+            "op": "subscribe",
+            "args": [{"instType": "mc", "channel": "candle1m", "instId": symbol} for symbol in stream.symbols[start:start + SUBSCRIBE_BATCH_SIZE]]
+        }))
+
+def on_error(ws, error):
+    """Handles any WebSocket errors."""
+    print(f"WebSocket error: {error}. Reconnecting in 5 seconds...")
+    time.sleep(5)
+    start_streaming()
+
+def on_close(ws, close_status_code, close_msg):
+    """Handles WebSocket closure."""
+    print("WebSocket connection closed. Reconnecting...")
+    start_streaming()
+
+def start_streaming():
+    """Seed the engine from the stored candles and the latest cointegrated pairs, then stream ticks into it."""
+    global stream, ws
+    pairs = load_cointegrated_pairs()  # Reload pairs on restart to pick up the latest hourly scan
+    if not pairs:
+        print("No cointegrated pairs found; run main.py first.")
+        return
+
+    stream = LiveZScore(pairs, window=window)
+    stream.seed(load_price_panel())
+
+    ws = websocket.WebSocketApp(WS_URL,
+                                on_open=on_open,
+                                on_message=on_message,
+                                on_error=on_error,
+                                on_close=on_close)
+    ws.run_forever(sslopt={"cert_reqs": ssl.CERT_NONE})
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream live Z-score entry signals for the latest cointegrated pairs.")
+    parser.add_argument("--window", type=int, default=STREAM_WINDOW, help="Number of hourly bars in each pair's Z-score window.")
+    args = parser.parse_args()
+    window = args.window
+
+    start_streaming()